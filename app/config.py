@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 import os
 
@@ -14,12 +15,78 @@ class Settings(BaseSettings):
     DB_PASSWORD: str
     DB_NAME: str
 
+    # Connection pool settings
+    DB_POOL_SIZE: int = 20
+    DB_MAX_OVERFLOW: int = 40
+    DB_POOL_RECYCLE: int = 1800  # Seconds before a pooled connection is replaced
+    DB_POOL_TIMEOUT: int = 30  # Seconds to wait for a free connection before erroring
+    SLOW_QUERY_MS: int = 100  # Statements slower than this are logged as warnings
+
+    # Schema setup at startup: "sync" runs create_all before serving (local dev),
+    # "async" runs `alembic upgrade head` in the background while /health reports
+    # 503, "none" leaves migrations to the deploy pipeline
+    MIGRATION_MODE: str = "sync"
+    MIGRATION_LOCK_TIMEOUT: str = "5s"  # Fail fast instead of queueing behind live traffic
+
     # Application settings
     APP_NAME: str
     ENVIRONMENT: str
     OPENAI_API_KEY: str
     GEMINI_API_KEY: str
 
+    # Digest used for upload deduplication: "sha256" (OpenSSL, SHA-NI accelerated
+    # where the CPU supports it) or "blake3" (SIMD + multithreaded, needs the
+    # blake3 package). Changing it on an existing database breaks duplicate
+    # detection against documents hashed with the previous algorithm.
+    FILE_HASH_ALGORITHM: str = "sha256"
+
+    # Embedding inference backend: "torch", "onnx" or "openvino" (the latter two
+    # need the optimum extras, see requirements.txt)
+    EMBEDDING_BACKEND: str = "torch"
+    # Torch backend precision: "auto" (FP16 on CUDA, FP32 on CPU), "bf16" or "fp32"
+    EMBEDDING_PRECISION: str = "auto"
+    # Worker processes that embed document chunks in parallel on CPU; 0 encodes
+    # in the API process (the right choice on GPU, where one process keeps it busy)
+    EMBEDDING_PROCESSES: int = 0
+    # Torch intra-op threads for CPU inference; 0 keeps torch's default. When
+    # several API workers (or EMBEDDING_PROCESSES) share a host, divide the
+    # cores between them to avoid oversubscription
+    EMBEDDING_THREADS: int = 0
+
+    # Search candidates fetched per requested result through the binary-quantized
+    # index (Hamming distance) and reranked by exact cosine distance; 0 searches
+    # the halfvec index directly
+    SEARCH_RERANK_OVERSAMPLE: int = 0
+    # Seconds a cached search result is served. The cache is per process and
+    # only cleared in the worker that stores new chunks, so with several API
+    # workers this bounds how long the others may return stale results
+    SEARCH_CACHE_TTL_SECONDS: float = 60
+
+    # URL the LLM providers can reach this API at (e.g. https://rag.example.com).
+    # When set, data/processed is served under /static/processed and OpenAI
+    # fetches prompt images from there instead of receiving them base64-encoded
+    PUBLIC_BASE_URL: Optional[str] = None
+    # OpenAI vision detail for prompt images: "auto", "high", or "low" (one
+    # 512px tile, ~85 tokens per image; cheapest, but small text gets hard to read)
+    OPENAI_IMAGE_DETAIL: str = "auto"
+
+    # Connection pool of the HTTP client shared by LLM API calls
+    LLM_MAX_CONNECTIONS: int = 64
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 32
+
+    # Cosine similarity above which a new query over the same search results
+    # is answered from the LLM response cache of an earlier, paraphrased one
+    LLM_CACHE_SIMILARITY: float = 0.95
+
+    # Requests each LLM provider may have in flight at once, per process.
+    # Excess queries wait their turn instead of running into rate limits
+    # (429s and backoff) on the provider side
+    OPENAI_MAX_CONCURRENCY: int = 16
+    GEMINI_MAX_CONCURRENCY: int = 8
+
+    # Indent the JSON written to data/processed (readable, but much slower to write)
+    PROCESSED_JSON_INDENT: bool = False
+
     # File paths
     BASE_DIR: Path = Path(__file__).resolve().parent.parent
     DATA_DIR: Path = BASE_DIR / "data"
@@ -36,6 +103,10 @@ class Settings(BaseSettings):
     def DATABASE_URL(self) -> str:
         return f"postgresql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
     def create_directories(self):
         """Create necessary directories if they don't exist."""
         for directory in [self.DATA_DIR, self.RAW_PDF_DIR, self.PROCESSED_DIR, self.MEDIA_DIR]:
@@ -1,23 +1,27 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.product import Product
 from app.schemas.product import ProductCreate
 
-def get_product(db: Session, product_id: int) -> Product | None:
+async def get_product(db: AsyncSession, product_id: int) -> Product | None:
     """Gets a product by its primary key ID."""
-    return db.query(Product).filter(Product.id == product_id).first()
+    return await db.get(Product, product_id)
 
-def get_product_by_name(db: Session, name: str) -> Product | None:
-    return db.query(Product).filter(Product.name == name).first()
+async def get_product_by_name(db: AsyncSession, name: str) -> Product | None:
+    result = await db.execute(select(Product).where(Product.name == name))
+    return result.scalars().first()
 
-def create_product(db: Session, product: ProductCreate) -> Product:
-    db_product = Product(name=product.name)
-    db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+async def get_products(db: AsyncSession, skip: int = 0, limit: int = 100) -> list[Product]:
+    result = await db.execute(select(Product).offset(skip).limit(limit))
+    return result.scalars().all()
+
+async def create_product(db: AsyncSession, product: ProductCreate) -> Product:
+    db_product = (await db.scalars(insert(Product).values(name=product.name).returning(Product))).one()
+    await db.commit()
     return db_product
 
-def get_or_create_product(db: Session, name: str) -> Product:
-    db_product = get_product_by_name(db=db, name=name)
+async def get_or_create_product(db: AsyncSession, name: str) -> Product:
+    db_product = await get_product_by_name(db=db, name=name)
     if db_product:
         return db_product
-    return create_product(db=db, product=ProductCreate(name=name)) 
\ No newline at end of file
+    return await create_product(db=db, product=ProductCreate(name=name))
\ No newline at end of file
@@ -1,14 +1,65 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, select, text
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from app.models.document import Document
 from app.schemas.document import DocumentCreate
 from typing import Optional
+from cachetools import TTLCache
 
-def get_document_by_hash(db: Session, file_hash: str) -> Optional[Document]:
-    return db.query(Document).filter(Document.file_hash == file_hash).first()
+# Columns of schemas.document.Document, serialized by Postgres
+DOCUMENTS_JSON_SQL = """
+SELECT coalesce(jsonb_agg(to_jsonb(d) ORDER BY d.id), '[]'::jsonb)::text
+FROM (
+    SELECT id, filename, version, title, content_type, file_path, file_hash,
+           original_filename, product_id, created_at, updated_at
+    FROM documents
+    ORDER BY id
+    OFFSET :skip LIMIT :limit
+) d
+"""
 
-def create_document(db: Session, document: DocumentCreate) -> Document:
-    db_document = Document(
+# Chunk and embedding counts per document. Scans every chunk, so it backs
+# an on-demand admin endpoint rather than anything on the search path.
+VECTORIZATION_STATS_SQL = """
+SELECT d.id AS document_id,
+       d.filename,
+       COUNT(dc.id) AS total_chunks,
+       COUNT(dc.embedding) AS vectorized_chunks
+FROM documents d
+LEFT JOIN document_chunks dc ON d.id = dc.document_id
+GROUP BY d.id, d.filename
+ORDER BY d.id
+"""
+
+# Short-lived per-process caches of detached Document rows. Entries are
+# dropped whenever a document is written through invalidate_document().
+_documents_by_id: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+_documents_by_hash: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+def _remember(db: AsyncSession, document: Optional[Document]) -> Optional[Document]:
+    """Detach a loaded document from its session and cache it by id and hash."""
+    if document is not None:
+        db.expunge(document)
+        _documents_by_id[document.id] = document
+        _documents_by_hash[document.file_hash] = document
+    return document
+
+def invalidate_document(document: Document):
+    """Drop a document from the lookup caches after it has been modified."""
+    _documents_by_id.pop(document.id, None)
+    _documents_by_hash.pop(document.file_hash, None)
+
+async def get_document_by_hash(db: AsyncSession, file_hash: str) -> Optional[Document]:
+    cached = _documents_by_hash.get(file_hash)
+    if cached is not None:
+        return cached
+    result = await db.execute(select(Document).where(Document.file_hash == file_hash))
+    return _remember(db, result.scalars().first())
+
+async def create_document(db: AsyncSession, document: DocumentCreate) -> Document:
+    # RETURNING populates id and created_at in the same round trip as the INSERT
+    stmt = insert(Document).values(
         filename=document.filename,
         version=document.version,
         title=document.title,
@@ -17,18 +68,48 @@ def create_document(db: Session, document: DocumentCreate) -> Document:
         file_hash=document.file_hash,
         original_filename=document.original_filename,
         product_id=document.product_id
-    )
+    ).returning(Document)
     try:
-        db.add(db_document)
-        db.commit()
-        db.refresh(db_document)
-        return db_document
+        db_document = (await db.scalars(stmt)).one()
+        await db.commit()
+        # Cache the new row so an immediate re-upload of the same file is
+        # rejected without a lookup; uq_document_hash remains the real guard
+        return _remember(db, db_document)
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
-def get_document(db: Session, document_id: int):
-    return db.query(Document).filter(Document.id == document_id).first()
+async def get_document(db: AsyncSession, document_id: int) -> Optional[Document]:
+    cached = _documents_by_id.get(document_id)
+    if cached is not None:
+        return cached
+    result = await db.execute(select(Document).where(Document.id == document_id))
+    return _remember(db, result.scalars().first())
+
+async def get_documents(
+    db: AsyncSession, skip: int = 0, limit: int = 100,
+    include_chunks: bool = False, include_product: bool = False
+) -> list[Document]:
+    stmt = select(Document).offset(skip).limit(limit)
+    if include_product:
+        # One SELECT for the page's products rather than one per document
+        stmt = stmt.options(selectinload(Document.product))
+    if include_chunks:
+        # One extra SELECT ... WHERE document_id IN (...) instead of one per document
+        stmt = stmt.options(selectinload(Document.chunks))
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+async def get_documents_json(db: AsyncSession, skip: int = 0, limit: int = 100) -> str:
+    """
+    Return a page of documents as a JSON array string built by Postgres.
+    Skips ORM hydration and Pydantic serialization for the list endpoint;
+    the string can be sent to the client as-is.
+    """
+    result = await db.execute(text(DOCUMENTS_JSON_SQL), {"skip": skip, "limit": limit})
+    return result.scalar_one()
 
-def get_documents(db: Session, skip: int = 0, limit: int = 100):
-    return db.query(Document).offset(skip).limit(limit).all() 
\ No newline at end of file
+async def get_vectorization_stats(db: AsyncSession) -> list[dict]:
+    """Return total and vectorized chunk counts for every document."""
+    result = await db.execute(text(VECTORIZATION_STATS_SQL))
+    return [dict(row) for row in result.mappings()]
\ No newline at end of file
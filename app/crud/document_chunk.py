@@ -0,0 +1,101 @@
+import csv
+import hashlib
+import io
+from typing import Dict, List
+import numpy as np
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+from app.database import get_dbapi_connection, json_dumps
+from app.models.document_chunk import DocumentChunk
+
+# Drivers whose cursors support COPY FROM STDIN
+COPY_DRIVERS = {"psycopg2"}
+
+# PostgreSQL caps a single statement at 65535 bind parameters
+MAX_BIND_PARAMS = 65535
+
+COPY_CHUNKS_SQL = """
+COPY document_chunks (document_id, content, embedding, chunk_metadata)
+FROM STDIN WITH (FORMAT csv)
+"""
+
+def to_vector_literal(embedding) -> str | None:
+    """
+    Format an embedding as a pgvector text literal.
+    A JSON array is the same '[x,y,...]' syntax pgvector parses; orjson
+    writes NumPy arrays directly, without converting them to lists first.
+    """
+    if embedding is None:
+        return None
+    return json_dumps(embedding)
+
+def copy_chunks(db: Session, chunks: List[Dict]) -> int:
+    """
+    Stream chunk rows into document_chunks with a single COPY FROM STDIN.
+    Runs in the session's transaction; the caller is responsible for committing.
+    """
+    if not chunks:
+        return 0
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for chunk in chunks:
+        writer.writerow([
+            chunk['document_id'],
+            chunk['content'],
+            to_vector_literal(chunk['embedding']),  # None is written as NULL
+            json_dumps(chunk['chunk_metadata'])
+        ])
+    buffer.seek(0)
+
+    cursor = get_dbapi_connection(db).cursor()
+    try:
+        cursor.copy_expert(COPY_CHUNKS_SQL, buffer)
+    finally:
+        cursor.close()
+    return len(chunks)
+
+def get_embeddings_by_content(db: Session, contents: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Look up stored embeddings of chunks whose content exactly matches one of
+    contents, through the md5(content) index. Returns float32 embeddings
+    keyed by content; texts that were never embedded are absent.
+    """
+    if not contents:
+        return {}
+
+    # Postgres' md5() hashes the UTF-8 bytes of the text, like this does
+    hashes = [hashlib.md5(content.encode('utf-8')).hexdigest() for content in contents]
+    content_hash = func.md5(DocumentChunk.content)
+    stmt = (
+        select(DocumentChunk.content, DocumentChunk.embedding)
+        .where(content_hash.in_(hashes), DocumentChunk.embedding.is_not(None))
+        .distinct(content_hash)
+    )
+    wanted = set(contents)
+    return {
+        content: embedding.to_numpy().astype(np.float32)
+        for content, embedding in db.execute(stmt)
+        if content in wanted
+    }
+
+def supports_copy(db: Session) -> bool:
+    """Whether the session's driver can stream rows with COPY."""
+    return db.get_bind().dialect.driver in COPY_DRIVERS
+
+def bulk_create_chunks(db: Session, chunks: List[Dict], batch_size: int = 500) -> int:
+    """
+    Insert chunk rows with multi-row INSERTs, in batches.
+    Fallback for connections where COPY is unavailable. Runs in the session's
+    transaction; the caller is responsible for committing.
+    """
+    if not chunks:
+        return 0
+
+    # Keep each multi-VALUES statement under the bind parameter limit
+    num_columns = len(chunks[0])
+    batch_size = min(batch_size, MAX_BIND_PARAMS // num_columns)
+
+    for start in range(0, len(chunks), batch_size):
+        db.execute(insert(DocumentChunk), chunks[start:start + batch_size])
+    return len(chunks)
\ No newline at end of file
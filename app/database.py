@@ -1,14 +1,84 @@
-from sqlalchemy import create_engine, MetaData, text
+from sqlalchemy import create_engine, MetaData, text, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from pgvector.asyncpg import register_vector
+from alembic import command
+from alembic.config import Config
 from .config import settings
 import logging
+import time
+import orjson
 
 logger = logging.getLogger(__name__)
 
-# Create database engine
-engine = create_engine(settings.DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def json_dumps(value) -> str:
+    """
+    Serialize JSON/JSONB column values with orjson: several times faster than
+    json.dumps on the nested chunk_metadata dicts, and NumPy values (bbox
+    floats, arrays) are serialized natively.
+    """
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+# Create database engine with a pool sized for concurrent API workers
+engine = create_engine(
+    settings.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_pre_ping=True,  # Detect connections dropped by the server before use
+    pool_use_lifo=True,  # Reuse warm connections so idle ones can be recycled
+    # Multi-row VALUES for INSERT executemany (the default) plus psycopg2's
+    # execute_batch for UPDATE/DELETE executemany, instead of one round trip per row
+    executemany_mode="values_plus_batch",
+    json_serializer=json_dumps,
+    json_deserializer=orjson.loads
+)
+# Objects stay loaded after commit; writes use RETURNING instead of refresh()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+# Async engine (asyncpg) for the read-heavy request path, so DB waits
+# don't block the event loop
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_pre_ping=True,
+    pool_use_lifo=True,
+    json_serializer=json_dumps,
+    json_deserializer=orjson.loads
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+@event.listens_for(async_engine.sync_engine, "connect")
+def _register_vector_codec(dbapi_connection, connection_record):
+    """
+    Use pgvector's binary codec on asyncpg connections, so float32 NumPy
+    arrays are sent as raw float4 buffers instead of text literals.
+    """
+    dbapi_connection.run_async(register_vector)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    """Log statements slower than SLOW_QUERY_MS, on both engines."""
+    elapsed_ms = (time.perf_counter() - conn.info["query_start_time"].pop()) * 1000
+    if elapsed_ms > settings.SLOW_QUERY_MS:
+        logger.warning(f"Slow query ({elapsed_ms:.1f} ms): {statement[:500]}")
+
+def pool_status() -> dict:
+    """Connection pool checkouts for both engines, for the health endpoint."""
+    return {
+        "sync": engine.pool.status(),
+        "async": async_engine.pool.status()
+    }
 
 # Base class for database models
 Base = declarative_base()
@@ -30,10 +100,34 @@ def init_db():
         logger.error(f"Error initializing database: {str(e)}")
         raise
 
+def run_migrations():
+    """
+    Upgrade the schema to the latest Alembic revision.
+    Blocking; async startup runs it in a worker thread.
+    """
+    config = Config(str(settings.BASE_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(settings.BASE_DIR / "migrations"))
+    # Keep the application's logging setup instead of alembic.ini's
+    config.attributes["configure_logger"] = False
+    command.upgrade(config, "head")
+    logger.info("Database migrations applied successfully")
+
+def get_dbapi_connection(db: Session):
+    """
+    Return the raw DBAPI (psycopg2) connection behind a session.
+    Statements run on it share the session's current transaction.
+    """
+    return db.connection().connection.driver_connection
+
 def get_db():
     """Dependency for database session."""
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Dependency for async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db 
\ No newline at end of file
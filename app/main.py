@@ -1,12 +1,18 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional, Dict
+import asyncio
+import json
 import logging
+import numpy as np
 from sqlalchemy.exc import IntegrityError
 
 from app.config import settings
-from app.database import init_db, get_db
+from app.database import init_db, run_migrations, pool_status, get_db, get_async_db
 from app.models import document as models_doc # Renamed to avoid conflict
 from app.models import product as models_prod # Import product model
 from app.schemas import document as schemas_document # Rename existing schema import
@@ -15,11 +21,13 @@ from app.crud import document as crud_document # Rename existing crud import
 from app.crud import crud_product # Add product crud import
 from app.services.pdf_service import PDFService
 from app.services.search_service import SearchService
-from app.services.embedding_service import EmbeddingService
+from app.services.embedding_service import EmbeddingService, query_cache_stats
 from app.models import Document, DocumentChunk
 from app.services.file_service import FileService
-from app.services.vector_service import VectorService
-from app.services.llm_service import LLMService
+from app.services.vector_service import VectorService, stop_encode_pool
+from app.services.llm_service import LLMService, warm_up_provider, image_cache_stats, response_cache_stats
+from app.services.http_client import close_http_client
+from app.services import chunker, scorer
 
 logger = logging.getLogger(__name__)
 
@@ -46,14 +54,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.PUBLIC_BASE_URL:
+    # Page images and tables, fetched by OpenAI when they appear in a prompt
+    app.mount(
+        "/static/processed",
+        StaticFiles(directory=settings.PROCESSED_DIR, check_dir=False),
+        name="processed"
+    )
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize application on startup."""
     # Create necessary directories
     settings.create_directories()
+
+    # Compile the semantic cache scorer in the background instead of on the first search
+    app.state.scorer_warm_up = asyncio.create_task(asyncio.to_thread(scorer.warm_up))
+    app.state.chunker_warm_up = asyncio.create_task(asyncio.to_thread(chunker.warm_up))
+    # Build the shared provider (and its SDK client) in a worker thread and
+    # open its API connection, so the first search pays for neither
+    app.state.llm_warm_up = asyncio.create_task(warm_up_provider("gemini"))
     
     # Initialize database
-    init_db()
+    app.state.migrations_ready = False
+    if settings.MIGRATION_MODE == "async":
+        # Serve /health right away; keep a reference so the task isn't collected
+        app.state.migrations_task = asyncio.create_task(run_migrations_async())
+    elif settings.MIGRATION_MODE == "none":
+        app.state.migrations_ready = True
+    else:
+        init_db()
+        app.state.migrations_ready = True
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release resources held for the lifetime of the application."""
+    stop_encode_pool()
+    await close_http_client()
+
+async def run_migrations_async():
+    """Apply Alembic migrations in a worker thread and flag readiness when done."""
+    try:
+        await asyncio.to_thread(run_migrations)
+        app.state.migrations_ready = True
+    except Exception as e:
+        logger.error(f"Error running database migrations: {str(e)}", exc_info=True)
 
 @app.get("/")
 async def root():
@@ -62,28 +107,43 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
+    """Health check endpoint. Returns 503 until the schema is ready."""
+    if not app.state.migrations_ready:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "starting",
+                "environment": settings.ENVIRONMENT,
+                "database": "migrating"
+            }
+        )
     return {
         "status": "healthy",
         "environment": settings.ENVIRONMENT,
-        "database": "connected"
+        "database": "connected",
+        "pool": pool_status(),
+        "query_embedding_cache": query_cache_stats(),
+        "image_cache": image_cache_stats(),
+        "llm_response_cache": response_cache_stats()
     }
 
 # Test endpoints for Document
 @app.get("/documents/", response_model=List[schemas_document.Document], tags=["documents"])
-def read_documents(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def read_documents(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
     """
     Retrieve a list of documents with pagination support.
     """
-    documents = crud_document.get_documents(db, skip=skip, limit=limit)
-    return documents
+    # The JSON is built in Postgres and passed through untouched;
+    # response_model only documents the shape
+    documents_json = await crud_document.get_documents_json(db, skip=skip, limit=limit)
+    return Response(content=documents_json, media_type="application/json")
 
 @app.get("/documents/{document_id}", response_model=schemas_document.Document, tags=["documents"])
-def read_document(document_id: int, db: Session = Depends(get_db)):
+async def read_document(document_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Retrieve a specific document by its ID.
     """
-    db_document = crud_document.get_document(db, document_id=document_id)
+    db_document = await crud_document.get_document(db, document_id=document_id)
     if db_document is None:
         raise HTTPException(status_code=404, detail="Document not found")
     return db_document
@@ -130,6 +190,50 @@ async def process_document(
         logger.error(f"Error processing document: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/admin/vectorize", response_model=Dict, tags=["admin"])
+async def bulk_vectorize_documents(
+    document_ids: List[int] = Query(...),
+    db: Session = Depends(get_db)
+):
+    """
+    Vectorize several already processed documents as one bulk load.
+    
+    The HNSW embedding index is dropped first and rebuilt concurrently once
+    all chunks are inserted, which is much faster than maintaining the
+    index row by row during ingestion. The index DDL can take minutes, so
+    it runs in a worker thread instead of stalling the event loop.
+    """
+    vector_service = VectorService(db)
+    try:
+        await asyncio.to_thread(vector_service.drop_embedding_index)
+        vector_results = []
+        try:
+            for document_id in document_ids:
+                vector_results.append(await vector_service.vectorize_document(document_id))
+        finally:
+            # Always restore the index, even if one of the documents failed
+            await asyncio.to_thread(vector_service.create_embedding_index)
+        
+        return {
+            "status": "success",
+            "message": f"Vectorized {len(vector_results)} documents",
+            "vector_results": vector_results
+        }
+        
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error during bulk vectorization: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/documents/stats", response_model=List[Dict], tags=["admin"])
+async def read_vectorization_stats(db: AsyncSession = Depends(get_async_db)):
+    """
+    Chunk and embedding counts per document, for checking that documents
+    were vectorized. Scans all chunks, so it is not meant for frequent polling.
+    """
+    return await crud_document.get_vectorization_stats(db)
+
 @app.get("/search")
 async def search_documents(
     query: str,
@@ -137,7 +241,7 @@ async def search_documents(
     limit: int = 5,
     threshold: float = 0.7,
     # Remove: document_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Search for similar content within documents of a specific product.
@@ -161,11 +265,12 @@ async def search_documents(
             product_id=product_id, # Pass mandatory product_id
             # Remove: document_id=document_id,
         )
-        return {
+        # Results are plain JSON types already, so skip jsonable_encoder's walk
+        return JSONResponse({
             "query": query,
             "product_id": product_id, # Include product_id in response
             "results": results
-        }
+        })
     except Exception as e:
         # Consider adding specific exception handling for product not found if SearchService doesn't handle it
         logger.error(f"Error during search for product {product_id}: {str(e)}", exc_info=True)
@@ -180,7 +285,7 @@ async def search_by_example(
     x2: float,
     y2: float,
     limit: int = 5,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Search for similar content using a selected region from a document.
@@ -213,7 +318,7 @@ async def upload_document(
     version: Optional[str] = Form(None), # Keep optional fields as Form data
     title: Optional[str] = Form(None),
     content_type: Optional[str] = Form(None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Upload a PDF document and associate it with a product ID.
@@ -226,10 +331,8 @@ async def upload_document(
     if not file.filename.lower().endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are allowed")
 
-    # Optional: Validate product_id exists
-    db_product = crud_product.get_product(db, product_id=product_id) # Assuming get_product exists in crud_product
-    if not db_product:
-        raise HTTPException(status_code=404, detail=f"Product with ID {product_id} not found.")
+    # product_id isn't looked up beforehand: the documents.product_id foreign key
+    # rejects unknown products on INSERT and the IntegrityError handler maps it to 400
 
     try:
         file_service = FileService()
@@ -237,11 +340,11 @@ async def upload_document(
         # Save file and get info
         file_info = await file_service.save_uploaded_file(file)
         current_file_hash = file_info["file_hash"]
-        logger.info(f"Calculated hash for uploaded file '{file.filename}': {current_file_hash}") # Log hash
         
         # Check if document with same hash exists
-        logger.info(f"Checking database for existing document with hash: {current_file_hash}") # Log before check
-        existing_doc = crud_document.get_document_by_hash(db, current_file_hash)
+        existing_doc = await crud_document.get_document_by_hash(db, current_file_hash)
+        # Lazy %-formatting: nothing is formatted unless DEBUG is enabled
+        logger.debug("upload file=%s hash=%s existing=%s", file.filename, current_file_hash, bool(existing_doc))
         
         if existing_doc:
             logger.warning(f"Found existing document (ID: {existing_doc.id}) with hash {current_file_hash}. Deleting uploaded file.") # Log if found
@@ -251,8 +354,6 @@ async def upload_document(
                 status_code=409,
                 detail=f"Document already exists with ID: {existing_doc.id}"
             )
-        else:
-            logger.info(f"No existing document found with hash: {current_file_hash}. Proceeding with creation.") # Log if not found
         
         # Create document record schema
         document_data = schemas_document.DocumentCreate(
@@ -267,7 +368,7 @@ async def upload_document(
         )
         
         # Create document in DB
-        return crud_document.create_document(db, document=document_data)
+        return await crud_document.create_document(db, document=document_data)
         
     except ValueError as e:
         # Catch potential value errors (though less likely here now)
@@ -276,9 +377,11 @@ async def upload_document(
     except IntegrityError as e:
         # Catch DB constraint violations (e.g., non-existent product_id, duplicate hash if check failed somehow)
         logger.error(f"Database integrity error creating document: {str(e)}", exc_info=True)
-        db.rollback() # Rollback the session
-        # Check if it's a foreign key violation specifically
-        if "violates foreign key constraint" in str(e).lower() and "fk_document_product" in str(e).lower():
+        await db.rollback() # Rollback the session
+        # No document row references the saved file
+        file_service.delete_file(file_info["file_path"])
+        # Check if it's the product foreign key (its name depends on how the schema was created)
+        if "violates foreign key constraint" in str(e).lower() and "product" in str(e).lower():
              raise HTTPException(status_code=400, detail=f"Error creating document: Product ID {product_id} does not exist.")
         # Check if it's the unique hash constraint (should have been caught earlier, but for robustness)
         elif "violates unique constraint" in str(e).lower() and "uq_document_hash" in str(e).lower():
@@ -291,7 +394,7 @@ async def upload_document(
         logger.error(f"Unexpected error uploading document: {str(e)}", exc_info=True)
         # Ensure rollback in case of other errors during DB operations
         try:
-            db.rollback()
+            await db.rollback()
         except Exception as rb_e:
             logger.error(f"Error during rollback attempt: {rb_e}")
         raise HTTPException(status_code=500, detail="Internal server error during document upload")
@@ -305,7 +408,8 @@ async def enhanced_search(
     # Remove: document_id: Optional[int] = None,
     context_pages: int = 3,
     include_detailed_results: bool = False,
-    db: Session = Depends(get_db)
+    stream: bool = False,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Enhanced search within a specific product, combining vector search with LLM.
@@ -318,22 +422,39 @@ async def enhanced_search(
     # Remove: - document_id: Optional document ID to search within
     - context_pages: Number of pages to include around matches
     - include_detailed_results: If True, includes detailed search results in response
+    - stream: If True, returns Server-Sent Events: an optional {"search_results": ...}
+      event, then {"token": ...} events as the answer is generated, then {"done": true}
     """
     # Remove: if document_id and product_id:
     # Remove:     raise HTTPException(status_code=400, detail="Cannot search by both document_id and product_id simultaneously.")
         
     try:
-        # First, perform the vector search, passing mandatory product_id
+        # Embed the query while the LLM client is being set up (off the event
+        # loop; the first request in a process builds the provider); the LLM
+        # call itself has to wait for the search results
         search_service = SearchService(db)
+        query_embedding, llm_service = await asyncio.gather(
+            search_service.embed_query(query),
+            asyncio.to_thread(LLMService, provider="gemini") # Or your configured provider
+        )
+
+        # Then perform the vector search, passing mandatory product_id
         search_results = await search_service.search(
             query=query,
             limit=limit,
             threshold=threshold,
             product_id=product_id, # Pass mandatory product_id
             # Remove: document_id=document_id,
-            context_pages=context_pages
+            context_pages=context_pages,
+            query_embedding=query_embedding
         )
         
+        if stream:
+            return StreamingResponse(
+                stream_llm_events(llm_service, query, query_embedding, search_results, include_detailed_results),
+                media_type="text/event-stream"
+            )
+
         # Check if search returned any results before calling LLM
         if not search_results:
              return {
@@ -344,10 +465,10 @@ async def enhanced_search(
              }
 
         # Then, generate an LLM response
-        llm_service = LLMService(provider="gemini") # Or your configured provider
         llm_response = await llm_service.generate_response(
             query=query,
-            search_results=search_results
+            search_results=search_results,
+            query_embedding=query_embedding
         )
 
         # Prepare response
@@ -367,31 +488,60 @@ async def enhanced_search(
         logger.error(f"Error in enhanced search for product {product_id}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(data: Dict) -> str:
+    return f"data: {json.dumps(data)}\n\n"
+
+async def stream_llm_events(
+    llm_service: LLMService, query: str, query_embedding: np.ndarray,
+    search_results: List[Dict], include_detailed_results: bool
+):
+    """Server-Sent Events for a streamed /search/enhanced answer."""
+    if include_detailed_results:
+        yield sse_event({"search_results": search_results})
+
+    if not search_results:
+        yield sse_event({"token": "No relevant documents found for this product to generate an answer."})
+    else:
+        try:
+            async for token in llm_service.stream_response(
+                query=query, search_results=search_results, query_embedding=query_embedding
+            ):
+                yield sse_event({"token": token})
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            logger.error(f"Error streaming LLM response: {str(e)}", exc_info=True)
+            yield sse_event({"error": str(e)})
+            return
+
+    yield sse_event({"done": True})
+
 # --- Product Endpoints ---
 
 @app.post("/products/", response_model=schemas_product.Product, tags=["products"])
-def create_product_endpoint(
+async def create_product_endpoint(
     product: schemas_product.ProductCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Creates a new product."""
-    db_product = crud_product.get_product_by_name(db, name=product.name)
+    db_product = await crud_product.get_product_by_name(db, name=product.name)
     if db_product:
         raise HTTPException(status_code=400, detail=f"Product with name '{product.name}' already exists.")
-    return crud_product.create_product(db=db, product=product)
+    return await crud_product.create_product(db=db, product=product)
 
 @app.get("/products/", response_model=List[schemas_product.Product], tags=["products"])
-def list_products_endpoint(
+async def list_products_endpoint(
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Lists all products with pagination."""
-    # Add a more standard list function in crud_product if needed
-    products = db.query(models_prod.Product).offset(skip).limit(limit).all()
-    return products
-
-from app.main import app
+    products = await crud_product.get_products(db, skip=skip, limit=limit)
+    # Serialize with the prebuilt adapter; response_model only documents the shape
+    adapter = schemas_product.ProductListAdapter
+    return Response(
+        content=adapter.dump_json(adapter.validate_python(products, from_attributes=True)),
+        media_type="application/json"
+    )
 
 if __name__ == "__main__":
     import uvicorn
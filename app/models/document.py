@@ -18,8 +18,13 @@ class Document(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
-    # Define relationship to Product
-    product = relationship("Product")
+    # Define relationship to Product. No schema serializes it, so it is never
+    # loaded implicitly; use selectinload() (include_product) when it is needed.
+    product = relationship("Product", back_populates="documents", lazy="raise")
+
+    # Chunks are never loaded implicitly: a lazy load per row would be an N+1
+    # (and fails under AsyncSession). Use selectinload() where they are needed.
+    chunks = relationship("DocumentChunk", back_populates="document", lazy="raise", passive_deletes=True)
 
     # Add unique constraint on file_hash
     __table_args__ = (UniqueConstraint('file_hash', name='uq_document_hash'),)
@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON, Index
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON, Index, cast
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from sqlalchemy.dialects.postgresql import ARRAY, FLOAT
+from sqlalchemy.dialects.postgresql import ARRAY, BIT, FLOAT, JSONB
 from app.database import Base
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC
 from typing import List
 
 class DocumentChunk(Base):
@@ -11,20 +12,47 @@ class DocumentChunk(Base):
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=False)
-    embedding = Column(Vector(384))  # Using pgvector's Vector type
-    chunk_metadata = Column(JSON, nullable=False)
+    embedding = Column(HALFVEC(384))  # pgvector half-precision vector, half the size of Vector
+    chunk_metadata = Column(JSONB, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    document = relationship("Document", back_populates="chunks")
     
     def __repr__(self):
         return f"<DocumentChunk {self.id} (doc_id: {self.document_id})>"
 
     # Add index for vector similarity search after table creation
     __table_args__ = (
+        # Serves document-scoped chunk scans (search filters, region lookup)
+        Index('ix_document_chunks_document_id', document_id, id),
+        # Page-range lookups of a document's chunks (search context pages)
+        Index(
+            'ix_document_chunks_document_page',
+            document_id,
+            cast(chunk_metadata['page_number'].astext, Integer)
+        ),
+        # Finds already embedded chunks with identical text (VectorService)
+        Index('ix_document_chunks_content_md5', func.md5(content)),
+        # Cosine HNSW graph for the <=> search; same definition as the migrations
         Index(
-            'idx_document_chunks_embedding',
+            'ix_chunks_embedding_hnsw',
             embedding,
-            postgresql_using='ivfflat',
-            postgresql_with={'lists': 100},
-            postgresql_ops={'embedding': 'vector_l2_ops'}
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'halfvec_cosine_ops'}
+        ),
+        # 1-bit quantized copy of the embedding (48 bytes per row) for the
+        # Hamming-distance candidate stage of SearchService's rerank mode
+        Index(
+            'ix_chunks_embedding_bq_hnsw',
+            cast(func.binary_quantize(embedding), BIT(384)).label('embedding_bq'),
+            postgresql_using='hnsw',
+            postgresql_ops={'embedding_bq': 'bit_hamming_ops'}
+        ),
+        Index(
+            'ix_chunks_metadata_gin',
+            chunk_metadata,
+            postgresql_using='gin',
+            postgresql_ops={'chunk_metadata': 'jsonb_path_ops'}
         ),
     ) 
\ No newline at end of file
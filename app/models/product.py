@@ -8,8 +8,9 @@ class Product(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), unique=True, index=True, nullable=False)
 
-    # Relationship back to documents (optional, for querying from product)
-    documents = relationship("Document", back_populates="product")
+    # Relationship back to documents (optional, for querying from product).
+    # Load explicitly with selectinload() to avoid one query per product.
+    documents = relationship("Document", back_populates="product", lazy="raise")
 
     def __repr__(self):
         return f"<Product {self.name}>" 
\ No newline at end of file
@@ -2,14 +2,55 @@ import fitz  # PyMuPDF
 import camelot
 import hashlib
 from pathlib import Path
-import json
+import orjson
 import os
 import logging
 from typing import Dict, List, Tuple, Optional
+from collections import defaultdict
 from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+def _write_json(path: Path, data) -> None:
+    """
+    Write data as UTF-8 JSON with orjson. Compact unless PROCESSED_JSON_INDENT
+    is set. Non-string keys (camelot's integer column names) become strings
+    and NumPy scalars from camelot's bboxes are serialized natively.
+    """
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    if settings.PROCESSED_JSON_INDENT:
+        option |= orjson.OPT_INDENT_2
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps(data, option=option))
+
+def process_page_range(pdf_path: str, document_id: int, page_nums: List[int]) -> List[Dict]:
+    """
+    Process a contiguous range of pages in a worker process.
+    Module-level so it can be pickled; each worker opens the PDF once
+    for its whole range.
+    """
+    processor = PDFProcessor(pdf_path, document_id)
+    tables_by_page = processor._extract_tables(page_nums)
+    with processor.open_pdf() as doc:
+        return [
+            processor._process_page(doc[page_num], page_num, tables_by_page[page_num + 1])
+            for page_num in page_nums
+        ]
+
+# Threads writing extracted images to disk for a page
+IMAGE_WRITE_WORKERS = 4
+
+def _write_bytes(path: Path, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _split_pages(page_count: int, parts: int) -> List[List[int]]:
+    """Split page numbers into at most `parts` contiguous, similarly sized ranges."""
+    size = -(-page_count // parts)  # ceil division
+    return [list(range(start, min(start + size, page_count))) for start in range(0, page_count, size)]
+
 class PDFProcessor:
     def __init__(self, pdf_path: str, document_id: int):
         """
@@ -45,23 +86,47 @@ class PDFProcessor:
                 self.doc.close()
                 self.doc = None
 
-    def process_pdf(self) -> Dict:
-        """Process PDF and extract text, images, and tables."""
+    def process_pdf(self, max_workers: Optional[int] = None) -> Dict:
+        """
+        Process PDF and extract text, images, and tables.
+        
+        Pages are independent and parsing is CPU-bound, so they are split
+        into ranges processed in parallel worker processes.
+        
+        Args:
+            max_workers: Number of worker processes (defaults to the CPU count)
+        """
         try:
             with self.open_pdf() as doc:
                 pdf_content = {
                     "metadata": self._extract_metadata(doc),
                     "pages": []
                 }
-                
-                for page_num in range(len(doc)):
-                    page_content = self._process_page(doc[page_num], page_num)
-                    pdf_content["pages"].append(page_content)
-                
-                # Save processing metadata
-                self._save_metadata(pdf_content)
-                
-                return pdf_content
+                page_count = len(doc)
+
+            workers = min(max_workers or os.cpu_count() or 1, page_count)
+            if workers <= 1:
+                tables_by_page = self._extract_tables(list(range(page_count)))
+                with self.open_pdf() as doc:
+                    for page_num in range(page_count):
+                        pdf_content["pages"].append(
+                            self._process_page(doc[page_num], page_num, tables_by_page[page_num + 1])
+                        )
+            else:
+                ranges = _split_pages(page_count, workers)
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [
+                        executor.submit(process_page_range, self.pdf_path, self.document_id, page_nums)
+                        for page_nums in ranges
+                    ]
+                    # Collect in submission order so pages stay in document order
+                    for future in futures:
+                        pdf_content["pages"].extend(future.result())
+
+            # Save processing metadata
+            self._save_metadata(pdf_content)
+
+            return pdf_content
                 
         except Exception as e:
             logger.error(f"Error processing PDF: {str(e)}")
@@ -78,18 +143,32 @@ class PDFProcessor:
             "page_count": len(doc)
         }
 
-    def _process_page(self, page: fitz.Page, page_num: int) -> Dict:
-        """Process a single page."""
+    def _process_page(self, page: fitz.Page, page_num: int, tables: List[Dict]) -> Dict:
+        """Process a single page; its tables are extracted up front by _extract_tables."""
         page_content = {
             "page_number": page_num + 1,
             "text": self._extract_text(page),
             "images": self._extract_images(page),
-            "tables": self._extract_tables(page_num)
+            "tables": tables
         }
         return page_content
 
-    def _extract_text(self, page: fitz.Page) -> List[Dict]:
-        """Extract text blocks with positions."""
+    def _extract_text(self, page: fitz.Page, from_spans: bool = False) -> List[Dict]:
+        """
+        Extract text blocks with positions.
+        
+        By default uses the "blocks" output, where MuPDF assembles each block's
+        text itself. from_spans=True joins the spans of the full "dict" output
+        instead, which is much slower.
+        """
+        if not from_spans:
+            # (x0, y0, x1, y1, text, block_no, block_type); type 0 is text
+            return [
+                {"text": " ".join(block[4].splitlines()), "bbox": block[:4], "type": "text"}
+                for block in page.get_text("blocks")
+                if block[6] == 0 and block[4].strip()
+            ]
+
         text_blocks = []
         for block in page.get_text("dict")["blocks"]:
             if "lines" in block:
@@ -104,64 +183,88 @@ class PDFProcessor:
         return text_blocks
 
     def _extract_images(self, page: fitz.Page) -> List[Dict]:
-        """Extract and save images from page."""
+        """
+        Extract and save images from page.
+        Files are written by a small thread pool while extraction continues;
+        all writes finish before the page's images are returned.
+        """
         images = []
         try:
-            for img_index, img in enumerate(page.get_images(full=True)):
-                xref = img[0]
-                base_image = self.doc.extract_image(xref)
+            with ThreadPoolExecutor(max_workers=IMAGE_WRITE_WORKERS) as pool:
+                writes = []
+                for img_index, img in enumerate(page.get_images(full=True)):
+                    xref = img[0]
+                    base_image = self.doc.extract_image(xref)
                 
-                if base_image:
-                    image_bytes = base_image["image"]
-                    image_ext = base_image["ext"]
-                    image_md5 = hashlib.md5(image_bytes).hexdigest()
-                    image_filename = f"page_{page.number + 1}_img_{img_index}_{image_md5}.{image_ext}"
-                    
-                    # Use absolute paths
-                    image_path = Path(os.getcwd()) / self.images_dir / image_filename
+                    if base_image:
+                        image_bytes = base_image["image"]
+                        image_ext = base_image["ext"]
+                        # Content hash for the filename only; blake2b is faster than MD5
+                        # and a 16-byte digest keeps the same 32-char name
+                        image_hash = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+                        image_filename = f"page_{page.number + 1}_img_{img_index}_{image_hash}.{image_ext}"
                     
-                    # Ensure the path is within the project directory
-                    if not str(image_path).startswith(str(Path(os.getcwd()))):
-                        raise ValueError(f"Invalid path: {image_path}")
+                        # Use absolute paths
+                        image_path = Path(os.getcwd()) / self.images_dir / image_filename
                     
-                    # Create directory if it doesn't exist
-                    image_path.parent.mkdir(parents=True, exist_ok=True)
+                        # Ensure the path is within the project directory
+                        if not str(image_path).startswith(str(Path(os.getcwd()))):
+                            raise ValueError(f"Invalid path: {image_path}")
                     
-                    # Save image
-                    with open(image_path, "wb") as f:
-                        f.write(image_bytes)
+                        # Create directory if it doesn't exist
+                        image_path.parent.mkdir(parents=True, exist_ok=True)
                     
-                    # Store relative path for database
-                    rel_path = str(image_path.relative_to(Path(os.getcwd())))
+                        # Save image in the background
+                        writes.append(pool.submit(_write_bytes, image_path, image_bytes))
                     
-                    images.append({
-                        "filename": image_filename,
-                        "path": rel_path,
-                        "bbox": img[-1],  # bounding box
-                        "type": "image"
-                    })
+                        # Store relative path for database
+                        rel_path = str(image_path.relative_to(Path(os.getcwd())))
                     
-                    logger.info(f"Saved image: {rel_path}")
+                        images.append({
+                            "filename": image_filename,
+                            "path": rel_path,
+                            "bbox": img[-1],  # bounding box
+                            "type": "image"
+                        })
+
+                # Wait for the writes; drop images whose file could not be saved
+                saved = []
+                for image, write in zip(images, writes):
+                    if write.exception() is not None:
+                        logger.error(f"Error saving image {image['path']}: {str(write.exception())}")
+                        continue
+                    saved.append(image)
+                    logger.info(f"Saved image: {image['path']}")
+                images = saved
                 
         except Exception as e:
             logger.error(f"Error extracting image: {str(e)}")
         
         return images
 
-    def _extract_tables(self, page_num: int) -> List[Dict]:
-        """Extract and save tables from page."""
-        tables = []
+    def _extract_tables(self, page_nums: List[int]) -> Dict[int, List[Dict]]:
+        """
+        Extract and save tables from a contiguous range of pages.
+        Camelot parses the PDF on every call, so the whole range is read
+        at once. Returns tables keyed by 1-based page number.
+        """
+        tables_by_page = defaultdict(list)
+        if not page_nums:
+            return tables_by_page
         try:
             # Extract tables using camelot
             extracted_tables = camelot.read_pdf(
                 self.pdf_path,
-                pages=str(page_num + 1),
+                pages=f"{page_nums[0] + 1}-{page_nums[-1] + 1}",
                 flavor='stream'
             )
             
-            for idx, table in enumerate(extracted_tables):
+            for table in extracted_tables:
+                page_number = int(table.page)
+                tables = tables_by_page[page_number]
+                idx = len(tables)
                 table_data = table.df.to_dict('records')
-                table_filename = f"page_{page_num + 1}_table_{idx}.json"
+                table_filename = f"page_{page_number}_table_{idx}.json"
                 
                 # Use absolute paths
                 table_path = Path(os.getcwd()) / self.tables_dir / table_filename
@@ -174,8 +277,7 @@ class PDFProcessor:
                 table_path.parent.mkdir(parents=True, exist_ok=True)
                 
                 # Save table as JSON
-                with open(table_path, 'w', encoding='utf-8') as f:
-                    json.dump(table_data, f, ensure_ascii=False, indent=2)
+                _write_json(table_path, table_data)
                 
                 # Store relative path for database
                 rel_path = str(table_path.relative_to(Path(os.getcwd())))
@@ -191,12 +293,11 @@ class PDFProcessor:
                 logger.info(f"Saved table: {rel_path}")
                 
         except Exception as e:
-            logger.error(f"Error extracting tables from page {page_num + 1}: {str(e)}")
+            logger.error(f"Error extracting tables from pages {page_nums[0] + 1}-{page_nums[-1] + 1}: {str(e)}")
         
-        return tables
+        return tables_by_page
 
     def _save_metadata(self, content: Dict):
         """Save processing metadata."""
         metadata_path = self.base_dir / "metadata.json"
-        with open(metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(content, f, ensure_ascii=False, indent=2) 
\ No newline at end of file
+        _write_json(metadata_path, content)
\ No newline at end of file
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import List
+from pydantic import BaseModel, TypeAdapter
 
 class ProductBase(BaseModel):
     name: str
@@ -10,4 +11,7 @@ class Product(ProductBase):
     id: int
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+# Built once at import; list endpoints validate and dump through it directly
+ProductListAdapter = TypeAdapter(List[Product])
\ No newline at end of file
@@ -0,0 +1,74 @@
+from typing import Callable, List, Optional, Tuple
+import asyncio
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class BatchEncoder:
+    """
+    Dynamic batching for texts embedded by concurrent requests.
+
+    Callers await encode() for a single text; a background task collects
+    pending texts until max_batch_size is reached or max_wait_ms has passed
+    since the first one arrived, then embeds them all with one call of
+    encode_batch in a worker thread. Under load this turns many one-text
+    forward passes into a few batched ones; an idle caller waits at most
+    max_wait_ms extra.
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5
+    ):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Embed one text as part of the next batch; returns its float32 row."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        """Wait for a first item, then gather more until the batch is full or the window closes."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Requests that were cancelled while queued don't need encoding
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                embeddings = await asyncio.to_thread(self.encode_batch, [text for text, _ in batch])
+            except Exception as e:
+                logger.error(f"Error encoding batch of {len(batch)} texts: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    # Copy the row so a cached result doesn't pin the whole batch
+                    future.set_result(embedding.copy())
\ No newline at end of file
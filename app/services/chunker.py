@@ -0,0 +1,40 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Optional, only speeds up chunking of long pages
+    njit = None
+
+def _chunk_starts(lengths: np.ndarray, chunk_size: int) -> np.ndarray:
+    starts = np.empty(lengths.shape[0], dtype=np.int64)
+    n = 0
+    current = 0
+    for i in range(lengths.shape[0]):
+        # A sentence that would overflow the current chunk starts a new one;
+        # a sentence longer than chunk_size becomes a chunk of its own
+        if i == 0 or current + lengths[i] > chunk_size:
+            starts[n] = i
+            n += 1
+            current = lengths[i]
+        else:
+            current += lengths[i]
+    return starts[:n]
+
+if njit is not None:
+    _chunk_starts = njit(cache=True)(_chunk_starts)
+
+def chunk_bounds(lengths: np.ndarray, chunk_size: int) -> list:
+    """
+    Greedily pack consecutive sentences, given their token counts, into chunks
+    of at most chunk_size tokens. Returns (start, stop) sentence index pairs.
+    Runs as a compiled loop when numba is installed, plain Python otherwise.
+    """
+    if lengths.shape[0] == 0:
+        return []
+    starts = _chunk_starts(lengths, chunk_size).tolist()
+    return list(zip(starts, starts[1:] + [lengths.shape[0]]))
+
+def warm_up() -> None:
+    """Compile the numba kernel ahead of the first upload (no-op without numba)."""
+    if njit is not None:
+        chunk_bounds(np.ones(1, dtype=np.int32), 1)
\ No newline at end of file
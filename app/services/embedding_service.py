@@ -1,16 +1,136 @@
 from sentence_transformers import SentenceTransformer
 from typing import List, Dict, Any, Optional
 import numpy as np
+import torch
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.models.document_chunk import DocumentChunk
+from app.services.chunker import chunk_bounds
+from app.services.batch_encoder import BatchEncoder
 import json
 import re
+import hashlib
 import logging
+import threading
 from pathlib import Path
+from cachetools import LRUCache
+from app.config import settings
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Process-wide cache of query embeddings, keyed by SHA-256 of the normalized
+# query. Shared by every EmbeddingService instance; guarded by a lock because
+# embeddings are created in worker threads.
+_query_embeddings: LRUCache = LRUCache(maxsize=2048)
+_query_cache_lock = threading.Lock()
+_query_cache_stats = {"hits": 0, "misses": 0}
+
+# Query embeddings requested concurrently (cache misses) are encoded
+# together; created with the first EmbeddingService's model
+QUERY_BATCH_SIZE = 64
+QUERY_BATCH_WAIT_MS = 5
+_query_encoder: Optional[BatchEncoder] = None
+
+# Patterns used by chunk_text, compiled once instead of looked up per call
+_WHITESPACE_RE = re.compile(r'\s+')
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+
+# Interop threads are fixed once torch has run anything in parallel, so the
+# thread counts are applied once per process, before the first model loads
+_torch_threads_configured = False
+
+def _configure_torch_threads():
+    global _torch_threads_configured
+    if _torch_threads_configured or settings.EMBEDDING_THREADS <= 0:
+        return
+    _torch_threads_configured = True
+    torch.set_num_threads(settings.EMBEDDING_THREADS)
+    try:
+        # encode() parallelizes within ops; a small interop pool is enough
+        torch.set_num_interop_threads(2)
+    except RuntimeError:
+        logger.warning("Torch interop threads were already initialized; keeping the default")
+    logger.info(f"Torch using {settings.EMBEDDING_THREADS} intra-op threads")
+
+# Loaded models, one per name for the whole process. Every EmbeddingService
+# and VectorService (created per request) shares them instead of loading
+# its own copy of the weights.
+_models: Dict[str, SentenceTransformer] = {}
+_models_lock = threading.Lock()
+
+def load_embedding_model(model_name: str) -> SentenceTransformer:
+    """
+    Return the process-wide instance of a model, loading it on first use.
+    Inference doesn't modify the model, so it is safe to share between
+    threads.
+    """
+    with _models_lock:
+        model = _models.get(model_name)
+        if model is None:
+            model = _models[model_name] = _create_embedding_model(model_name)
+            logger.info(f"Loaded embedding model {model_name}")
+        return model
+
+def _create_embedding_model(model_name: str) -> SentenceTransformer:
+    """
+    Load a SentenceTransformer with the inference backend set by
+    EMBEDDING_BACKEND: "torch" (default), or "onnx"/"openvino", which run an
+    exported, operator-fused graph and are markedly faster on CPU.
+    
+    For the torch backend, EMBEDDING_PRECISION applies: "auto" runs FP16 on
+    CUDA (tensor cores) and FP32 on CPU, "bf16" forces bfloat16 (worthwhile on
+    CPUs with AVX-512-BF16/AMX), "fp32" disables half precision. Embeddings
+    are cast back to float32 by the callers.
+    """
+    backend = settings.EMBEDDING_BACKEND.lower()
+    _configure_torch_threads()
+    model = SentenceTransformer(model_name, backend=backend)
+    if backend != "torch":
+        return model
+
+    precision = settings.EMBEDDING_PRECISION.lower()
+    if precision == "auto" and torch.cuda.is_available():
+        model.half()
+    elif precision == "bf16":
+        model.bfloat16()
+    elif precision not in ("auto", "fp32"):
+        raise ValueError(f"Unsupported EMBEDDING_PRECISION: {settings.EMBEDDING_PRECISION}")
+    return model
+
+def _bbox_array(bboxes: List[Any]) -> np.ndarray:
+    """Stack bboxes into an (N, 4) float array; malformed ones become NaN rows."""
+    boxes = np.full((len(bboxes), 4), np.nan)
+    for i, bbox in enumerate(bboxes):
+        try:
+            boxes[i] = [float(v) for v in bbox[:4]]
+        except (TypeError, ValueError, IndexError):
+            pass  # NaN compares false, so the box is never nearby
+    return boxes
+
+def _query_cache_key(text: str) -> bytes:
+    # all-MiniLM-L6-v2 lowercases its input, so case and spacing don't change the embedding
+    normalized = " ".join(text.lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).digest()
+
+def _cached_query_embedding(key: bytes) -> Optional[np.ndarray]:
+    with _query_cache_lock:
+        embedding = _query_embeddings.get(key)
+        _query_cache_stats["hits" if embedding is not None else "misses"] += 1
+        return embedding
+
+def _cache_query_embedding(key: bytes, embedding: np.ndarray) -> np.ndarray:
+    embedding.flags.writeable = False
+    with _query_cache_lock:
+        _query_embeddings[key] = embedding
+    return embedding
+
+def query_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters and current size of the query embedding cache."""
+    with _query_cache_lock:
+        return {**_query_cache_stats, "size": len(_query_embeddings)}
+
 class EmbeddingService:
     def __init__(self, model_name: str = 'all-MiniLM-L6-v2'):
         """
@@ -19,35 +139,104 @@ class EmbeddingService:
             model_name: The name of the sentence-transformer model to use
         """
         try:
-            self.model = SentenceTransformer(model_name)
-            self.chunk_size = 512  # Maximum tokens per chunk
+            self.model = load_embedding_model(model_name)
+            # Maximum tokens per chunk: the model's sequence length minus the
+            # [CLS]/[SEP] special tokens, so chunks are never truncated
+            max_seq_length = self.model.get_max_seq_length() or 512
+            self.chunk_size = max_seq_length - 2
             self.chunk_overlap = 50  # Overlap between chunks
             logger.info(f"Initialized EmbeddingService with model: {model_name}")
         except Exception as e:
             logger.error(f"Failed to initialize model {model_name}: {str(e)}")
             raise
         
-    def create_embeddings(self, text: str) -> List[float]:
+    def create_embeddings(self, text: str) -> np.ndarray:
         """
         Create embeddings for a piece of text.
         Args:
             text: The text to create embeddings for
         Returns:
-            List of floats representing the embedding vector
+            Normalized float32 array, which pgvector binds directly
         """
         try:
             if not text.strip():
                 raise ValueError("Empty text provided for embedding")
             
-            embedding = self.model.encode(text)
-            
-            # Ensure embedding is normalized
-            embedding = embedding / np.linalg.norm(embedding)
-            
-            return embedding.tolist()
+            # normalize_embeddings L2-normalizes inside encode(), on the model's tensors
+            embedding = self.model.encode(
+                text,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            return np.ascontiguousarray(embedding, dtype=np.float32)
         except Exception as e:
             logger.error(f"Error creating embedding: {str(e)}")
             raise
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """
+        Create the embedding for a search query, reusing cached embeddings of
+        previously seen queries.
+        Args:
+            text: The query text
+        Returns:
+            Read-only float32 array; it may be shared with other callers
+        """
+        key = _query_cache_key(text)
+        embedding = _cached_query_embedding(key)
+        if embedding is None:
+            embedding = _cache_query_embedding(key, self.create_embeddings(text))
+        return embedding
+
+    async def embed_query_batched(self, text: str) -> np.ndarray:
+        """
+        Async variant of embed_query for request handlers. Cache misses from
+        concurrent requests are encoded together in one forward pass, in a
+        worker thread, instead of one encode() call per request.
+        Args:
+            text: The query text
+        Returns:
+            Read-only float32 array; it may be shared with other callers
+        """
+        global _query_encoder
+        if not text.strip():
+            raise ValueError("Empty text provided for embedding")
+        key = _query_cache_key(text)
+        embedding = _cached_query_embedding(key)
+        if embedding is None:
+            if _query_encoder is None:
+                _query_encoder = BatchEncoder(
+                    self.embed_batch, max_batch_size=QUERY_BATCH_SIZE, max_wait_ms=QUERY_BATCH_WAIT_MS
+                )
+            embedding = _cache_query_embedding(key, await _query_encoder.encode(text))
+        return embedding
+
+    def embed_batch(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        """
+        Create embeddings for many texts in batched forward passes.
+        Args:
+            texts: The texts to create embeddings for
+            batch_size: Number of texts encoded per forward pass
+        Returns:
+            float32 array with one normalized embedding per text, in input order
+        """
+        try:
+            if not texts:
+                return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+            # normalize_embeddings L2-normalizes inside encode(), on the model's tensors
+            embeddings = self.model.encode(
+                texts,
+                batch_size=batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            return embeddings.astype(np.float32, copy=False)
+        except Exception as e:
+            logger.error(f"Error creating batch embeddings: {str(e)}")
+            raise
     
     def chunk_text(self, text: str) -> List[str]:
         """
@@ -59,36 +248,26 @@ class EmbeddingService:
         """
         try:
             # Remove extra whitespace and normalize
-            text = re.sub(r'\s+', ' ', text).strip()
-            
-            # Split into sentences (improved sentence splitting)
-            sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z])', text)
+            text = _WHITESPACE_RE.sub(' ', text).strip()
             
-            chunks = []
-            current_chunk = []
-            current_length = 0
+            # Every token covers at least one character, so most blocks (headers,
+            # captions, short paragraphs) fit in one chunk without tokenizing
+            if len(text) <= self.chunk_size:
+                return [text]
             
-            for sentence in sentences:
-                sentence_length = len(sentence.split())
-                
-                # If adding this sentence would exceed chunk size
-                if current_length + sentence_length > self.chunk_size:
-                    # If we have a current chunk, add it to chunks
-                    if current_chunk:
-                        chunks.append(' '.join(current_chunk))
-                    # Start new chunk with current sentence
-                    current_chunk = [sentence]
-                    current_length = sentence_length
-                else:
-                    # Add sentence to current chunk
-                    current_chunk.append(sentence)
-                    current_length += sentence_length
+            # Split into sentences (improved sentence splitting)
+            sentences = _SENTENCE_BOUNDARY_RE.split(text)
             
-            # Add the last chunk if it exists
-            if current_chunk:
-                chunks.append(' '.join(current_chunk))
+            # Token counts of all sentences in one batched call to the fast tokenizer
+            lengths = np.asarray(
+                self.model.tokenizer(sentences, add_special_tokens=False, return_length=True)['length'],
+                dtype=np.int32
+            )
+            if lengths.sum() <= self.chunk_size:
+                return [text]
             
-            return chunks
+            # Pack consecutive sentences into chunks of at most chunk_size tokens
+            return [' '.join(sentences[start:stop]) for start, stop in chunk_bounds(lengths, self.chunk_size)]
         except Exception as e:
             logger.error(f"Error chunking text: {str(e)}")
             raise
@@ -127,75 +306,68 @@ class EmbeddingService:
                     }
                     chunks_data.append(chunk_data)
             
+            # Since we don't have valid bbox for images, every chunk references all
+            # images from the page; build that list once and share it (read-only)
+            page_images = [
+                {'filename': img['filename'], 'path': img['path']}
+                for img in page_content.get('images', [])
+            ]
+            
+            # Proximity of every (chunk, table) pair on the page, computed at once
+            tables = page_content.get('tables', [])
+            nearby = self._nearby_mask(
+                [chunk_data['chunk_metadata']['bbox'] for chunk_data in chunks_data],
+                [table['bbox'] for table in tables]
+            )
+            
             # Add references to nearby images and tables
-            for chunk_data in chunks_data:
-                chunk_bbox = chunk_data['chunk_metadata']['bbox']
-                
-                # Add references to images - include all images from the same page
-                for img in page_content.get('images', []):
-                    # Since we don't have valid bbox for images, include all images from the page
-                    # but only include essential information
-                    chunk_data['chunk_metadata']['images'].append({
-                        'filename': img['filename'],
-                        'path': img['path']
-                    })
-                    logger.debug(f"Added image {img['filename']} to chunk")
+            for chunk_data, nearby_row in zip(chunks_data, nearby):
+                chunk_data['chunk_metadata']['images'] = page_images
                 
                 # Add references to tables
-                for table in page_content.get('tables', []):
-                    if self._is_nearby(chunk_bbox, table['bbox']):
-                        chunk_data['chunk_metadata']['tables'].append({
-                            'filename': table['filename'],
-                            'path': table['path'],
-                            'bbox': table['bbox']
-                        })
+                for table_index in np.flatnonzero(nearby_row):
+                    table = tables[table_index]
+                    chunk_data['chunk_metadata']['tables'].append({
+                        'filename': table['filename'],
+                        'path': table['path'],
+                        'bbox': table['bbox']
+                    })
             
             return chunks_data
         except Exception as e:
             logger.error(f"Error processing page content: {str(e)}")
             raise
     
-    def _is_nearby(self, bbox1: List[float], bbox2: List[float], threshold: float = 200) -> bool:
+    def _nearby_mask(self, bboxes1: List[Any], bboxes2: List[Any], threshold: float = 200) -> np.ndarray:
         """
-        Check if two bounding boxes are near each other.
+        Check which bounding boxes are near each other, for all pairs at once.
+        Boxes are nearby if they overlap or their centers are within threshold.
         Args:
-            bbox1: First bounding box coordinates [x0, y0, x1, y1]
-            bbox2: Second bounding box coordinates [x0, y0, x1, y1]
+            bboxes1: First list of bounding boxes [x0, y0, x1, y1]
+            bboxes2: Second list of bounding boxes [x0, y0, x1, y1]
             threshold: Maximum distance to be considered nearby
         Returns:
-            Boolean indicating if boxes are nearby
+            Boolean matrix of shape (len(bboxes1), len(bboxes2)); pairs with
+            a missing or malformed bbox are never nearby
         """
-        try:
-            # First check if boxes overlap or are very close
-            # Check for overlap
-            if (bbox1[0] < bbox2[2] and bbox1[2] > bbox2[0] and  # horizontal overlap
-                bbox1[1] < bbox2[3] and bbox1[3] > bbox2[1]):    # vertical overlap
-                return True
-
-            # Calculate center points
-            center1 = [(bbox1[0] + bbox1[2]) / 2, (bbox1[1] + bbox1[3]) / 2]
-            center2 = [(bbox2[0] + bbox2[2]) / 2, (bbox2[1] + bbox2[3]) / 2]
-
-            # Calculate distance between centers
-            distance = ((center1[0] - center2[0]) ** 2 + (center1[1] - center2[1]) ** 2) ** 0.5
-
-            # Consider boxes nearby if distance is within threshold
-            is_nearby = distance < threshold
-
-            # Log the distances for debugging
-            logger.debug(f"Checking proximity between boxes:")
-            logger.debug(f"Box1: {bbox1}")
-            logger.debug(f"Box2: {bbox2}")
-            logger.debug(f"Center1: {center1}")
-            logger.debug(f"Center2: {center2}")
-            logger.debug(f"Distance: {distance}")
-            logger.debug(f"Threshold: {threshold}")
-            logger.debug(f"Is nearby: {is_nearby}")
-
-            return is_nearby
-        except Exception as e:
-            logger.error(f"Error checking proximity: {str(e)}")
-            return False
+        boxes1 = _bbox_array(bboxes1)[:, None, :]
+        boxes2 = _bbox_array(bboxes2)[None, :, :]
+        
+        # Check for overlap
+        overlap = (
+            (boxes1[..., 0] < boxes2[..., 2]) & (boxes1[..., 2] > boxes2[..., 0]) &  # horizontal overlap
+            (boxes1[..., 1] < boxes2[..., 3]) & (boxes1[..., 3] > boxes2[..., 1])    # vertical overlap
+        )
+        
+        # Squared distance between centers
+        centers1 = (boxes1[..., :2] + boxes1[..., 2:]) / 2
+        centers2 = (boxes2[..., :2] + boxes2[..., 2:]) / 2
+        distance_sq = ((centers1 - centers2) ** 2).sum(axis=-1)
+        
+        is_nearby = overlap | (distance_sq < threshold ** 2)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"{int(is_nearby.sum())} of {is_nearby.size} box pairs are nearby (threshold {threshold})")
+        return is_nearby
     
     def store_chunks(self, db: Session, chunks_data: List[Dict]) -> List[DocumentChunk]:
         """
@@ -207,24 +379,34 @@ class EmbeddingService:
             List of created DocumentChunk objects
         """
         try:
-            chunks = []
+            if not chunks_data:
+                return []
+
+            # Embed all chunks at once; rows line up with chunks_data
+            embeddings = self.embed_batch([chunk_data['content'] for chunk_data in chunks_data])
             
-            for chunk_data in chunks_data:
-                # Create embedding for the chunk
-                embedding = self.create_embeddings(chunk_data['content'])
-                
-                # Create chunk record
-                chunk = DocumentChunk(
-                    document_id=chunk_data['document_id'],
-                    content=chunk_data['content'],
-                    embedding=embedding,
-                    chunk_metadata=chunk_data['chunk_metadata']  # Updated reference
-                )
-                
-                db.add(chunk)
-                chunks.append(chunk)
+            rows = [
+                {
+                    'document_id': chunk_data['document_id'],
+                    'content': chunk_data['content'],
+                    'embedding': embedding,
+                    'chunk_metadata': chunk_data['chunk_metadata']  # Updated reference
+                }
+                for chunk_data, embedding in zip(chunks_data, embeddings)
+            ]
             
+            # ORM bulk INSERT: multi-row VALUES statements (insertmanyvalues)
+            # instead of a unit-of-work flush per object; RETURNING hands back
+            # the created rows in input order
+            chunks = db.scalars(
+                insert(DocumentChunk).returning(DocumentChunk, sort_by_parameter_order=True),
+                rows
+            ).all()
             db.commit()
+            # Cached search results don't include the new chunks (imported here:
+            # search_service imports this module)
+            from app.services.search_service import search_cache
+            search_cache.clear()
             logger.info(f"Successfully stored {len(chunks)} chunks")
             return chunks
             
@@ -235,7 +417,7 @@ class EmbeddingService:
 
     async def find_similar_chunks(
         self,
-        db: Session,
+        db: AsyncSession,
         query: str,
         limit: int = 5,
         threshold: float = 0.7
@@ -243,7 +425,7 @@ class EmbeddingService:
         """
         Find similar chunks to a query using cosine similarity.
         Args:
-            db: Database session
+            db: Async database session
             query: Query text to find similar chunks for
             limit: Maximum number of results to return
             threshold: Minimum similarity score to include in results
@@ -251,13 +433,31 @@ class EmbeddingService:
             List of similar chunks with their metadata
         """
         try:
-            # Create embedding for the query
-            query_embedding = self.create_embeddings(query)
+            # Create embedding for the query off the event loop, batched with
+            # concurrent queries
+            query_embedding = await self.embed_query_batched(query)
             
-            # TODO: Implement vector similarity search
-            # This will be implemented when we add the similarity search functionality
+            # Ordering by raw cosine distance with a LIMIT lets the HNSW index
+            # (ix_chunks_embedding_hnsw) drive the scan
+            distance = DocumentChunk.embedding.cosine_distance(query_embedding)
+            stmt = (
+                select(DocumentChunk, distance.label('distance'))
+                .where(distance < 1 - threshold)
+                .order_by(distance)
+                .limit(limit)
+            )
             
-            return []
+            result = await db.execute(stmt)
+            return [
+                {
+                    'id': chunk.id,
+                    'document_id': chunk.document_id,
+                    'content': chunk.content,
+                    'chunk_metadata': chunk.chunk_metadata,
+                    'similarity': 1 - float(chunk_distance)
+                }
+                for chunk, chunk_distance in result
+            ]
             
         except Exception as e:
             logger.error(f"Error finding similar chunks: {str(e)}")
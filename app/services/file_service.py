@@ -1,14 +1,59 @@
+import asyncio
 import hashlib
 from pathlib import Path
 from datetime import datetime
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 import os
 from typing import Dict, Optional
 from fastapi import UploadFile
 import logging
+from app.config import settings
+
+try:
+    import blake3
+except ImportError:  # Optional, only needed for FILE_HASH_ALGORITHM=blake3
+    blake3 = None
 
 logger = logging.getLogger(__name__)
 
+# Size of each read from the spooled upload; two buffers are reused per upload
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def new_file_hasher():
+    """Create the hasher for file_hash; both options produce a 64-char hex digest."""
+    algorithm = settings.FILE_HASH_ALGORITHM.lower()
+    if algorithm == "sha256":
+        return hashlib.sha256()
+    if algorithm == "blake3":
+        if blake3 is None:
+            raise ValueError("FILE_HASH_ALGORITHM is 'blake3' but the blake3 package is not installed")
+        return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    raise ValueError(f"Unsupported FILE_HASH_ALGORITHM: {settings.FILE_HASH_ALGORITHM}")
+
+def _copy_and_hash(src, dst_path: Path, file_hash) -> None:
+    """
+    Copy src to dst_path and feed the same bytes to file_hash, in one pass.
+    Each chunk is written by a writer thread while this thread hashes it and
+    reads the next one into the other buffer; both release the GIL, so
+    hashing and disk I/O overlap.
+    """
+    buffers = [bytearray(UPLOAD_CHUNK_SIZE), bytearray(UPLOAD_CHUNK_SIZE)]
+    current = 0
+    pending_write = None
+    src.seek(0)
+    with open(dst_path, "wb") as dst, ThreadPoolExecutor(max_workers=1) as writer:
+        while n := src.readinto(buffers[current]):
+            view = memoryview(buffers[current])[:n]
+            # The previous chunk must be on disk before its buffer is reused
+            if pending_write is not None:
+                pending_write.result()
+            pending_write = writer.submit(dst.write, view)
+            file_hash.update(view)
+            current ^= 1
+        if pending_write is not None:
+            pending_write.result()
+
 class FileService:
     def __init__(self, raw_dir: str = "data/raw"):
         self.raw_dir = Path(raw_dir)
@@ -29,30 +74,33 @@ class FileService:
             base_filename = Path(original_filename).stem
             new_filename = f"{base_filename}_{timestamp}{file_extension}"
             
-            # Create full file path
+            # Create full file path; data is written to a temporary name first so
+            # a partially written upload never appears under the final name
             file_path = self.raw_dir / new_filename
+            tmp_path = file_path.with_name(new_filename + ".part")
             
             # Calculate hash while saving file
-            sha256_hash = hashlib.sha256()
+            file_hash = new_file_hasher()
             
-            # Save file and calculate hash
-            with open(file_path, "wb") as buffer:
-                while chunk := await file.read(8192):  # Read in chunks
-                    sha256_hash.update(chunk)
-                    buffer.write(chunk)
+            # The request body is already spooled by the time the endpoint runs,
+            # so copy and hash it in a single pass off the event loop: no
+            # event loop round trip per chunk, and no allocation per chunk
+            await asyncio.to_thread(_copy_and_hash, file.file, tmp_path, file_hash)
+            os.replace(tmp_path, file_path)
             
             return {
                 "original_filename": original_filename,
                 "saved_filename": new_filename,
                 "file_path": str(file_path),
-                "file_hash": sha256_hash.hexdigest()
+                "file_hash": file_hash.hexdigest()
             }
             
         except Exception as e:
             logger.error(f"Error saving file: {str(e)}")
             # Clean up if file was partially saved
-            if 'file_path' in locals() and os.path.exists(file_path):
-                os.remove(file_path)
+            for path in (locals().get('tmp_path'), locals().get('file_path')):
+                if path and os.path.exists(path):
+                    os.remove(path)
             raise
 
     def delete_file(self, file_path: str):
@@ -0,0 +1,59 @@
+from typing import Optional
+import importlib.util
+import httpx
+import orjson
+from app.config import settings
+
+# Vision calls can take tens of seconds, connecting should not
+LLM_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+
+# Idle connections are kept for a minute so back-to-back requests skip the
+# TCP and TLS handshakes
+LLM_KEEPALIVE_EXPIRY = 60
+
+class _OrjsonAsyncClient(httpx.AsyncClient):
+    """
+    AsyncClient that encodes json= request bodies with orjson instead of the
+    stdlib json module. Vision requests carry base64 images, so bodies run to
+    megabytes and their encoding is a noticeable share of each call's CPU.
+    """
+
+    def build_request(self, method, url, *, content=None, json=None, headers=None, **kwargs) -> httpx.Request:
+        if json is not None and content is None:
+            try:
+                content = orjson.dumps(json)
+            except TypeError:
+                pass  # Something orjson can't encode; let httpx handle it
+            else:
+                json = None
+                headers = httpx.Headers(headers)
+                headers["Content-Type"] = "application/json"
+        return super().build_request(method, url, content=content, json=json, headers=headers, **kwargs)
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    The pooled client shared by every outgoing LLM API call in this process,
+    created on first use. HTTP/2 multiplexes concurrent calls over one
+    connection when h2 is installed.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _OrjsonAsyncClient(
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+            ),
+            timeout=LLM_TIMEOUT
+        )
+    return _http_client
+
+async def close_http_client():
+    """Close the shared HTTP connection pool, if it was created."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
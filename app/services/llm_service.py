@@ -1,62 +1,274 @@
-from typing import List, Dict, Optional, Protocol
+from typing import AsyncIterator, List, Dict, Optional, Protocol, Tuple
+import asyncio
 import logging
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 from google import genai
+from google.genai import types
+from google.genai import errors as genai_errors
 #from google.ai import generativelanguage as glm
 from PIL import Image
 from app.config import settings
-import base64
+from app.services.http_client import LLM_TIMEOUT, get_http_client
+import binascii
+import hashlib
+import io
+import mimetypes
+import os
+import threading
 from pathlib import Path
+import orjson
+from cachetools import LRUCache, TTLCache
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+import numpy as np
+from app.services.semantic_cache import SemanticCache
 from abc import ABC, abstractmethod
 
 logger = logging.getLogger(__name__)
 
+# Chat completion parameters, shared by realtime and batch requests
+OPENAI_COMPLETION_PARAMS = {"model": "gpt-4-vision-preview", "temperature": 0.7, "max_tokens": 2000}
+
+# Seconds between status checks of a submitted OpenAI batch
+OPENAI_BATCH_POLL_INTERVAL = 60.0
+
+# Attempts per LLM call (the first try plus retries) when the API is rate
+# limited, returns a server error, or the connection drops
+LLM_MAX_ATTEMPTS = 5
+
+def _is_retryable_gemini_error(exc: BaseException) -> bool:
+    if isinstance(exc, genai_errors.APIError):
+        return exc.code == 429 or exc.code >= 500
+    return isinstance(exc, httpx.TransportError)
+
+def _gemini_retrying() -> AsyncRetrying:
+    """
+    Retry policy for Gemini calls: exponential backoff with jitter, waiting
+    with asyncio.sleep so other requests keep running in the meantime.
+    OpenAI calls get the same policy from the SDK's own retries.
+    """
+    return AsyncRetrying(
+        wait=wait_random_exponential(multiplier=0.5, max=8),
+        stop=stop_after_attempt(LLM_MAX_ATTEMPTS),
+        retry=retry_if_exception(_is_retryable_gemini_error),
+        sleep=asyncio.sleep,
+        before_sleep=lambda state: logger.warning(
+            f"Gemini call failed (attempt {state.attempt_number}), retrying: {state.outcome.exception()}"
+        ),
+        reraise=True
+    )
+
+# google-genai 1.9.0 can't be handed an httpx client, so the Gemini client
+# itself is shared to keep its connection pool alive across requests
+_gemini_client: Optional[genai.Client] = None
+
+def _get_gemini_client() -> genai.Client:
+    global _gemini_client
+    if _gemini_client is None:
+        _gemini_client = genai.Client(
+            api_key=settings.GEMINI_API_KEY,
+            http_options=types.HttpOptions(timeout=int(LLM_TIMEOUT.read * 1000))
+        )
+    return _gemini_client
+
+# Image formats each provider accepts as-is; others are re-encoded first
+OPENAI_IMAGE_TYPES = {"image/png", "image/jpeg", "image/webp", "image/gif"}
+GEMINI_IMAGE_TYPES = {"image/png", "image/jpeg", "image/webp", "image/heic", "image/heif"}
+
+# Longest side, in pixels, past which a provider gains nothing from more
+# resolution. Larger page screenshots are downsampled and sent as JPEG,
+# which cuts upload size and per-tile image tokens.
+OPENAI_IMAGE_MAX_SIDE = 2048
+GEMINI_IMAGE_MAX_SIDE = 3072
+IMAGE_JPEG_QUALITY = 85
+
+def _prepare_image_bytes(path: Path, max_side: int, supported_types: set) -> Tuple[bytes, str]:
+    """
+    Read an image as (bytes, mime type) ready to send to a provider.
+    Images in a supported format that fit within max_side are sent as the
+    file's bytes, skipping a decode and re-encode; the rest are
+    downsampled to fit and re-encoded as JPEG.
+    """
+    mime_type = mimetypes.guess_type(path.name)[0]
+    with Image.open(path) as image:
+        # Only the header has been read at this point
+        if mime_type in supported_types and max(image.size) <= max_side:
+            return path.read_bytes(), mime_type
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha channel; flatten transparent areas onto white
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue(), "image/jpeg"
+
+# Bytes encoded per step when building a data URL; a multiple of 3, so the
+# encoded pieces join into one valid base64 string
+BASE64_CHUNK_SIZE = 3 * 256 * 1024
+
+def _data_url(data: bytes, mime_type: str) -> str:
+    """
+    Encode data as a base64 data URL. The base64 text is written chunk by
+    chunk into one preallocated buffer, so besides the input and the result
+    only a chunk-sized temporary exists, not a full intermediate copy.
+    """
+    prefix = f"data:{mime_type};base64,".encode('ascii')
+    url = bytearray(len(prefix) + 4 * ((len(data) + 2) // 3))
+    url[:len(prefix)] = prefix
+    position = len(prefix)
+    view = memoryview(data)
+    for start in range(0, len(data), BASE64_CHUNK_SIZE):
+        encoded = binascii.b2a_base64(view[start:start + BASE64_CHUNK_SIZE], newline=False)
+        url[position:position + len(encoded)] = encoded
+        position += len(encoded)
+    return url.decode('ascii')
+
+# Data URLs of OpenAI prompt images, keyed by (path, mtime, size) so a
+# rewritten file is never served stale; bounded by total encoded size.
+# Follow-up questions on the same document reuse the same screenshots, and
+# a cached URL is put into the request as-is, without another copy.
+_data_urls: LRUCache = LRUCache(maxsize=256 * 1024 * 1024, getsizeof=len)
+_data_urls_lock = threading.Lock()
+_data_url_stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+
+# Second tier: each image's data URL is also written next to it, as
+# <image>.dataurl, so it survives restarts and outlives LRU eviction.
+# The first line records the source's mtime and size; a sidecar whose
+# header doesn't match the current file is ignored and rewritten.
+DATA_URL_SUFFIX = ".dataurl"
+
+def _data_url_header(key: Tuple[str, int, int]) -> bytes:
+    return f"{key[1]} {key[2]}".encode('ascii')
+
+def _load_data_url(path: Path, key: Tuple[str, int, int]) -> Optional[str]:
+    try:
+        raw = path.with_name(path.name + DATA_URL_SUFFIX).read_bytes()
+    except OSError:
+        return None
+    header, _, url = raw.partition(b"\n")
+    if header != _data_url_header(key) or not url:
+        return None
+    return url.decode('ascii')
+
+def _store_data_url(path: Path, key: Tuple[str, int, int], url: str):
+    sidecar = path.with_name(path.name + DATA_URL_SUFFIX)
+    # Unique temporary name: concurrent misses on one image may race here
+    tmp = sidecar.with_name(f"{sidecar.name}.{os.getpid()}.{threading.get_ident()}.part")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_data_url_header(key) + b"\n")
+            f.write(url.encode('ascii'))
+        os.replace(tmp, sidecar)
+    except OSError as e:
+        # The cache is an optimization; a read-only data directory just goes without
+        logger.debug(f"Could not write {sidecar}: {str(e)}")
+        tmp.unlink(missing_ok=True)
+
+def _read_data_url(path: Path) -> str:
+    """Prepare an image for OpenAI and return it as a base64 data URL, cached."""
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _data_urls_lock:
+        url = _data_urls.get(key)
+    outcome = "hits"
+    if url is None:
+        url = _load_data_url(path, key)
+        outcome = "disk_hits"
+        if url is None:
+            url = _data_url(*_prepare_image_bytes(path, OPENAI_IMAGE_MAX_SIDE, OPENAI_IMAGE_TYPES))
+            _store_data_url(path, key, url)
+            outcome = "misses"
+        with _data_urls_lock:
+            try:
+                _data_urls[key] = url
+            except ValueError:
+                pass  # Larger than the whole cache; just don't keep it
+    with _data_urls_lock:
+        _data_url_stats[outcome] += 1
+    return url
+
+def image_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters and current size of the OpenAI image data URL cache."""
+    with _data_urls_lock:
+        return {**_data_url_stats, "size": len(_data_urls), "bytes": _data_urls.currsize}
+
+def _public_image_url(path: Path) -> Optional[str]:
+    """URL the API serves a processed image at, if PUBLIC_BASE_URL is configured."""
+    if not settings.PUBLIC_BASE_URL:
+        return None
+    try:
+        relative = path.resolve().relative_to(settings.PROCESSED_DIR.resolve())
+    except ValueError:
+        return None  # Not under data/processed, so not served
+    return f"{settings.PUBLIC_BASE_URL.rstrip('/')}/static/processed/{relative.as_posix()}"
+
+def _openai_image_url(path: Path) -> str:
+    """
+    URL for an image_url content part: the image's public URL when OpenAI
+    can fetch it from this API (no base64 overhead on the request), else a
+    base64 data URL. Raises FileNotFoundError for missing images.
+    """
+    public_url = _public_image_url(path)
+    if public_url is not None and path.is_file():
+        return public_url
+    return _read_data_url(path)
+
+# Gemini Files API handles of uploaded prompt images, keyed by
+# (path, mtime, size). Uploaded files expire after 48 hours, so entries are
+# dropped an hour before that. Only touched from the event loop.
+_gemini_files: TTLCache = TTLCache(maxsize=4096, ttl=47 * 3600)
+
+# (bytes, mime type) of Gemini prompt images, keyed like _data_urls.
+# Images that can't be uploaded are sent inline on every turn, and
+# oversized or unsupported ones would otherwise be re-encoded each time.
+_gemini_images: LRUCache = LRUCache(maxsize=256 * 1024 * 1024, getsizeof=lambda image: len(image[0]))
+_gemini_images_lock = threading.Lock()
+
+def _read_gemini_image(path: Path) -> Tuple[bytes, str]:
+    """Prepare an image for Gemini and return it as (bytes, mime type), cached."""
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _gemini_images_lock:
+        image = _gemini_images.get(key)
+    if image is None:
+        image = _prepare_image_bytes(path, GEMINI_IMAGE_MAX_SIDE, GEMINI_IMAGE_TYPES)
+        with _gemini_images_lock:
+            try:
+                _gemini_images[key] = image
+            except ValueError:
+                pass  # Larger than the whole cache; just don't keep it
+    return image
+
 class LLMProvider(ABC):
     """Abstract base class for LLM providers."""
+
+    __slots__ = ()
     
     @abstractmethod
     async def generate_response(self, query: str, context: str, images: List[Dict]) -> str:
         """Generate a response using the provider's model."""
         pass
 
-class OpenAIProvider(LLMProvider):
-    """OpenAI implementation of LLM provider."""
-    
-    def __init__(self):
-        try:
-            self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-            logger.info("OpenAI client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client: {str(e)}")
-            raise
-
-    async def generate_response(self, query: str, context: str, images: List[Dict]) -> str:
-        try:
-            messages = [
-                {"role": "system", "content": self._get_system_prompt()},
-                {"role": "user", "content": self._prepare_prompt(query, context)}
-            ]
-
-            # Add image messages if available
-            if images:
-                image_messages = self._prepare_image_messages(images)
-                messages.extend(image_messages)
-
-            response = self.client.chat.completions.create(
-                model="gpt-4-vision-preview",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=2000
-            )
-
-            return response.choices[0].message.content
+    async def stream_response(self, query: str, context: str, images: List[Dict]) -> AsyncIterator[str]:
+        """
+        Yield the response in pieces as the model produces them.
+        Providers without streaming support yield the whole response at once.
+        """
+        yield await self.generate_response(query, context, images)
 
-        except Exception as e:
-            logger.error(f"Error generating OpenAI response: {str(e)}")
-            raise
+    async def warm_up(self):
+        """Open the connection to the provider's API ahead of the first query."""
+        pass
 
-    def _get_system_prompt(self) -> str:
-        return """You are a technical documentation expert specializing in software development, 
+# OpenAI prompts. The system prompt carries the role and guidelines and is
+# identical for every request, so requests begin with the same tokens and
+# automatic prompt caching can reuse that prefix.
+OPENAI_SYSTEM_PROMPT = """You are a technical documentation expert specializing in software development, 
         system architecture, and technical manuals. Your task is to analyze and present technical information 
         in a clear, structured, and professional manner.
 
@@ -70,34 +282,13 @@ class OpenAIProvider(LLMProvider):
         7. Use headings, bullet points, and code blocks appropriately
         8. If images are present, describe them in context and reference them naturally
         9. For each image, provide a detailed description of its content and relevance to the topic
-        10. Use image references in the format: [Image: description of the image]"""
-
-    def _prepare_prompt(self, query: str, context: str) -> str:
-        return f"""
-        You are a technical documentation expert specializing in software development, 
-        system architecture, and technical manuals. Your task is to analyze and present technical information 
-        in a clear, structured, and professional manner.
-
-        Guidelines:
-        1. Maintain technical accuracy while making the content accessible
-        2. Use appropriate technical terminology
-        3. Structure the response in a logical flow
-        4. Include relevant code snippets or technical details when appropriate
-        5. Reference diagrams, images, or tables when they are provided
-        6. Format the response in Markdown
-        7. Use headings, bullet points, and code blocks appropriately
-        8. For each image, use the following format:
+        10. For each image, use the following format:
            [IMAGE:image_path]
-           Example: [IMAGE:data/processed/1/images/page_38_img_0.png]
-
-        Query: {query}
-
-        Context from relevant documents:
-        {context}
-
-        Available Images:
-        {self._get_image_paths()}
+           Example: [IMAGE:data/processed/1/images/page_38_img_0.png]"""
 
+# The role and guidelines live in the system prompt only; the user message
+# starts with the per-answer checklist
+OPENAI_INSTRUCTIONS = """
         Please provide a comprehensive response that:
         1. Directly addresses the query
         2. Uses the provided context accurately
@@ -105,141 +296,210 @@ class OpenAIProvider(LLMProvider):
         4. Is formatted in Markdown
         5. Maintains technical accuracy
         6. For each image reference, use the [IMAGE:path] format
-        7. Ensure all image paths match exactly with the available images listed above
+        7. Ensure all image paths match exactly with the available images listed below
         8. Place image references immediately after the relevant text they illustrate
         """
 
-    def _get_image_paths(self) -> str:
-        """Get a formatted string of available image paths."""
-        if not hasattr(self, '_image_paths'):
-            return "No images available"
-        
-        return "\n".join([
-            f"- {path}" for path in self._image_paths
-        ])
+OPENAI_PROMPT_TEMPLATE = OPENAI_INSTRUCTIONS + """
+        Query: {query}
 
-    def _prepare_image_messages(self, images: List[Dict]) -> List[Dict]:
-        image_messages = []
-        for img in images:
-            image_path = Path(img['path'])
-            if image_path.exists():
-                try:
-                    with open(image_path, 'rb') as image_file:
-                        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                        image_messages.append({
-                            "role": "user",
-                            "content": [
-                                {
-                                    "type": "text",
-                                    "text": f"Image from page {img.get('page_number', 'unknown')}:"
-                                },
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/jpeg;base64,{base64_image}"
-                                    }
-                                }
-                            ]
-                        })
-                except Exception as e:
-                    logger.error(f"Error processing image {image_path}: {str(e)}")
-        return image_messages
+        Context from relevant documents:
+        {context}
 
-class GeminiProvider(LLMProvider):
-    """Google Gemini implementation of LLM provider."""
+        Available Images:
+        {image_paths}
+        """
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI implementation of LLM provider."""
+
+    __slots__ = ('client', '_semaphore')
     
     def __init__(self):
         try:
-            # Initialize Gemini client with API key
-            self.client = genai.Client(api_key=settings.GEMINI_API_KEY)
-            self.model_id = "gemini-2.0-flash"
-            logger.info("Gemini client initialized successfully")
+            # Async client, so waiting on the API never blocks the event loop
+            # The SDK retries rate limits, server errors and dropped connections
+            # itself, with jittered exponential backoff on asyncio.sleep
+            self.client = AsyncOpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                http_client=get_http_client(),
+                max_retries=LLM_MAX_ATTEMPTS - 1
+            )
+            # Bounds the API calls in flight; prompts are built outside it
+            self._semaphore = asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY)
+            logger.info("OpenAI client initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize Gemini client: {str(e)}")
+            logger.error(f"Failed to initialize OpenAI client: {str(e)}")
             raise
 
     async def generate_response(self, query: str, context: str, images: List[Dict]) -> str:
         try:
-            # Store image paths for the prompt
-            self._image_paths = [img['path'] for img in images]
-            
-            # Prepare the prompt
-            prompt = self._prepare_prompt(query, context)
-            
-            # Prepare content parts
-            contents = [prompt]
-            
-            # Add images if available
-            pil_images = [Image.open(path) for path in self._image_paths if Path(path).exists()]
-            contents.extend(pil_images)
-
-            # Generate response
-            response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=contents
-            )
+            messages = await self._build_messages(query, context, images)
+            async with self._semaphore:
+                response = await self.client.chat.completions.create(
+                    messages=messages,
+                    **OPENAI_COMPLETION_PARAMS
+                )
 
-            return response.text
+            return response.choices[0].message.content
 
         except Exception as e:
-            logger.error(f"Error generating Gemini response: {str(e)}")
+            logger.error(f"Error generating OpenAI response: {str(e)}")
             raise
 
-    # def _get_system_prompt(self) -> str:
-    #     return """You are a technical documentation expert specializing in software development, 
-    #     system architecture, and technical manuals. Your task is to analyze and present technical information 
-    #     in a clear, structured, and professional manner.
-
-    #     Guidelines:
-    #     1. Maintain technical accuracy while making the content accessible
-    #     2. Use appropriate technical terminology
-    #     3. Structure the response in a logical flow
-    #     4. Include relevant code snippets or technical details when appropriate
-    #     5. Reference diagrams, images, or tables when they are provided
-    #     6. Format the response in Markdown
-    #     7. Use headings, bullet points, and code blocks appropriately
-    #     8. If images are present, describe them in context and reference them naturally
-    #     9. For each image, provide a detailed description of its content and relevance to the topic
-    #     10. Use image references in the format: [Image: description of the image]"""
-
-    # def _prepare_prompt(self, query: str, context: str) -> str:
-    #     return f"""
-    #     You are a technical documentation expert specializing in software development, 
-    #     system architecture, and technical manuals. Your task is to analyze and present technical information 
-    #     in a clear, structured, and professional manner.
-
-    #     Guidelines:
-    #     1. Maintain technical accuracy while making the content accessible
-    #     2. Use appropriate technical terminology
-    #     3. Structure the response in a logical flow
-    #     4. Include relevant code snippets or technical details when appropriate
-    #     5. Reference diagrams, images, or tables when they are provided
-    #     6. Format the response in Markdown
-    #     7. Use headings, bullet points, and code blocks appropriately
-    #     8. For each image, use the following format:
-    #        [IMAGE:image_path]
-    #        Example: [IMAGE:data/processed/1/images/page_38_img_0.png]
-
-    #     Query: {query}
-
-    #     Context from relevant documents:
-    #     {context}
-
-    #     Available Images:
-    #     {self._get_image_paths()}
-
-    #     Please provide a comprehensive response that:
-    #     1. Directly addresses the query
-    #     2. Uses the provided context accurately
-    #     3. References any images or diagrams when relevant
-    #     4. Is formatted in Markdown
-    #     5. Maintains technical accuracy
-    #     6. For each image reference, use the [IMAGE:path] format
-    #     7. Ensure all image paths match exactly with the available images listed above
-    #     8. Place image references immediately after the relevant text they illustrate
-    #     """
+    async def stream_response(self, query: str, context: str, images: List[Dict]) -> AsyncIterator[str]:
+        try:
+            messages = await self._build_messages(query, context, images)
+            # The request stays in flight until the stream ends
+            async with self._semaphore:
+                stream = await self.client.chat.completions.create(
+                    messages=messages,
+                    stream=True,
+                    **OPENAI_COMPLETION_PARAMS
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+
+        except Exception as e:
+            logger.error(f"Error streaming OpenAI response: {str(e)}")
+            raise
+
+    async def submit_batch(self, requests: List[Dict]) -> str:
+        """
+        Submit prompts through the Batch API and return the batch id.
+        Each request has a custom_id plus the query, context and images of
+        generate_response(). Batches cost half as much as realtime calls but
+        complete within 24 hours, so use them for offline or bulk work only.
+        """
+        # Build every request's messages concurrently; their image reads all
+        # go to the executor at once instead of one request after another
+        all_messages = await asyncio.gather(
+            *(self._build_messages(request['query'], request['context'], request['images']) for request in requests)
+        )
+        lines = [
+            orjson.dumps({
+                "custom_id": request['custom_id'],
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"messages": messages, **OPENAI_COMPLETION_PARAMS}
+            })
+            for request, messages in zip(requests, all_messages)
+        ]
+        batch_file = await self.client.files.create(
+            file=("batch.jsonl", b"\n".join(lines)),
+            purpose="batch"
+        )
+        batch = await self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        logger.info(f"Submitted OpenAI batch {batch.id} with {len(lines)} requests")
+        return batch.id
+
+    async def await_batch(self, batch_id: str, poll_interval: float = OPENAI_BATCH_POLL_INTERVAL) -> Dict[str, str]:
+        """
+        Wait for a batch to finish and return its responses by custom_id.
+        Requests that failed are logged and left out of the result.
+        """
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status == "completed":
+                break
+            if batch.status in ("failed", "expired", "cancelled"):
+                raise RuntimeError(f"OpenAI batch {batch_id} ended with status {batch.status}")
+            await asyncio.sleep(poll_interval)
+
+        responses = {}
+        if batch.output_file_id:
+            output = await self.client.files.content(batch.output_file_id)
+            for line in output.content.splitlines():
+                result = orjson.loads(line)
+                response = result.get('response') or {}
+                if response.get('status_code') == 200:
+                    responses[result['custom_id']] = response['body']['choices'][0]['message']['content']
+                else:
+                    logger.error(f"Batch request {result['custom_id']} failed: {result.get('error') or response.get('body')}")
+        if batch.error_file_id:
+            errors = await self.client.files.content(batch.error_file_id)
+            for line in errors.content.splitlines():
+                result = orjson.loads(line)
+                logger.error(f"Batch request {result['custom_id']} failed: {result.get('error')}")
+        return responses
+
+    async def _build_messages(self, query: str, context: str, images: List[Dict]) -> List[Dict]:
+        # Start reading the images in worker threads before building the
+        # prompt, so file I/O and encoding overlap with the text work
+        reads = self._start_image_reads(images)
+
+        messages = [
+            {"role": "system", "content": self._get_system_prompt()},
+            {"role": "user", "content": self._prepare_prompt(query, context, [img['path'] for img in images])}
+        ]
+
+        # Add image messages if available
+        if images:
+            image_messages = await self._prepare_image_messages(images, reads)
+            messages.extend(image_messages)
+
+        return messages
+
     def _get_system_prompt(self) -> str:
-        return """You are a specialized technical documentation assistant for software installations, configurations, and technical procedures. You are focused on providing precise, actionable information from technical manuals, installation guides, and configuration documentation.
+        return OPENAI_SYSTEM_PROMPT
+
+    def _prepare_prompt(self, query: str, context: str, image_paths: List[str]) -> str:
+        return OPENAI_PROMPT_TEMPLATE.format(
+            query=query, context=context, image_paths=self._get_image_paths(image_paths)
+        )
+
+    @staticmethod
+    def _get_image_paths(image_paths: List[str]) -> str:
+        """Get a formatted string of available image paths."""
+        if not image_paths:
+            return "No images available"
+        
+        return "\n".join([
+            f"- {path}" for path in image_paths
+        ])
+
+    def _start_image_reads(self, images: List[Dict]) -> List[asyncio.Future]:
+        """Submit resolving each image's URL (reading and encoding it if needed) to the default executor right away."""
+        loop = asyncio.get_running_loop()
+        return [loop.run_in_executor(None, _openai_image_url, Path(img['path'])) for img in images]
+
+    async def _prepare_image_messages(self, images: List[Dict], reads: List[asyncio.Future]) -> List[Dict]:
+        # Wait for the concurrent reads started by _start_image_reads, keeping their order
+        urls = await asyncio.gather(*reads, return_exceptions=True)
+
+        image_messages = []
+        for img, url in zip(images, urls):
+            if isinstance(url, FileNotFoundError):
+                continue
+            if isinstance(url, Exception):
+                logger.error(f"Error processing image {img['path']}: {str(url)}")
+                continue
+            image_messages.append({
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"Image from page {img.get('page_number', 'unknown')}:"
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": url,
+                            "detail": settings.OPENAI_IMAGE_DETAIL
+                        }
+                    }
+                ]
+            })
+        return image_messages
+
+# Gemini prompts. The static instructions come before the request-specific
+# part of the prompt (see GeminiProvider._generation_config).
+GEMINI_SYSTEM_PROMPT = """You are a specialized technical documentation assistant for software installations, configurations, and technical procedures. You are focused on providing precise, actionable information from technical manuals, installation guides, and configuration documentation.
 
         Core Capabilities:
         1. You adapt your response length to match the query complexity - brief for simple questions, detailed for complex ones
@@ -262,17 +522,8 @@ class GeminiProvider(LLMProvider):
         10. Never invent information - rely solely on the provided context
         11. Focus precisely on answering the query without unnecessary elaboration
         12. Prioritize user needs - if they need a brief answer, be concise regardless of context volume"""
-    
-    def _prepare_prompt(self, query: str, context: str) -> str:
-        return f"""
-        Context from technical documentation:
-        {context}
-        
-        Available Images:
-        {self._get_image_paths()}
-        
-        User Query: {query}
-        
+
+GEMINI_INSTRUCTIONS = """
         Please respond according to these guidelines:
         
         1. RESPONSE LENGTH: Determine if this query requires:
@@ -315,32 +566,216 @@ class GeminiProvider(LLMProvider):
         - Screenshots are critical for helping users understand technical procedures - include them appropriately
         - For each image reference, use the [IMAGE:path] format exactly as provided in the available images list
         """
-    def _get_image_paths(self) -> str:
+
+GEMINI_PROMPT_TEMPLATE = GEMINI_INSTRUCTIONS + """
+        Context from technical documentation:
+        {context}
+        
+        Available Images:
+        {image_paths}
+        
+        User Query: {query}
+        """
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini implementation of LLM provider."""
+
+    __slots__ = ('client', 'model_id', '_semaphore')
+    
+    def __init__(self):
+        try:
+            # Shared Gemini client, so its connections outlive this provider
+            self.client = _get_gemini_client()
+            self.model_id = "gemini-2.0-flash"
+            # Bounds the API calls in flight, including retry backoff, so a
+            # rate-limited burst doesn't keep adding load
+            self._semaphore = asyncio.Semaphore(settings.GEMINI_MAX_CONCURRENCY)
+            logger.info("Gemini client initialized successfully")
+        except Exception as e:
+            logger.error(f"Failed to initialize Gemini client: {str(e)}")
+            raise
+
+    async def generate_response(self, query: str, context: str, images: List[Dict]) -> str:
+        try:
+            contents = await self._build_contents(query, context, images)
+            # Generate response through the client's async surface
+            async with self._semaphore:
+                async for attempt in _gemini_retrying():
+                    with attempt:
+                        response = await self.client.aio.models.generate_content(
+                            model=self.model_id,
+                            contents=contents,
+                            config=self._generation_config()
+                        )
+
+            return response.text
+
+        except Exception as e:
+            logger.error(f"Error generating Gemini response: {str(e)}")
+            raise
+
+    async def stream_response(self, query: str, context: str, images: List[Dict]) -> AsyncIterator[str]:
+        try:
+            contents = await self._build_contents(query, context, images)
+            # The request is only sent once the stream is iterated, so retry
+            # until the first chunk arrives; after that the answer has started
+            # reaching the caller and can't be restarted
+            async with self._semaphore:
+                async for attempt in _gemini_retrying():
+                    with attempt:
+                        stream = await self.client.aio.models.generate_content_stream(
+                            model=self.model_id,
+                            contents=contents,
+                            config=self._generation_config()
+                        )
+                        first = await anext(stream, None)
+                if first is None:
+                    return
+                if first.text:
+                    yield first.text
+                async for chunk in stream:
+                    if chunk.text:
+                        yield chunk.text
+
+        except Exception as e:
+            logger.error(f"Error streaming Gemini response: {str(e)}")
+            raise
+
+    def _generation_config(self) -> types.GenerateContentConfig:
+        # The static system prompt goes first, as the system instruction, followed
+        # by the static guidelines of _prepare_prompt; only then comes anything
+        # request specific, so Gemini's implicit caching can reuse the prefix
+        return types.GenerateContentConfig(system_instruction=self._get_system_prompt())
+
+    async def _build_contents(self, query: str, context: str, images: List[Dict]) -> List:
+        # Image paths for the prompt; kept local so concurrent requests on
+        # one provider never see each other's images
+        image_paths = [img['path'] for img in images]
+        
+        # Prepare the prompt
+        prompt = self._prepare_prompt(query, context, image_paths)
+        
+        # Prepare content parts
+        contents = [prompt]
+        
+        # Add images if available, as references to files uploaded once.
+        # Missing files are skipped here instead of being checked up front
+        # with a blocking exists() per image on the event loop.
+        image_parts = await asyncio.gather(
+            *(self._image_part(Path(path)) for path in image_paths),
+            return_exceptions=True
+        )
+        for part in image_parts:
+            if isinstance(part, FileNotFoundError):
+                continue
+            if isinstance(part, Exception):
+                raise part
+            contents.append(part)
+        return contents
+
+    async def _image_part(self, path: Path) -> types.Part:
+        """
+        Reference an image through the Files API, uploading it on first use.
+        Later queries about the same pages send only the file URI. If the
+        upload fails, the image is sent inline instead.
+        """
+        stat = await asyncio.to_thread(path.stat)
+        key = (str(path), stat.st_mtime_ns, stat.st_size)
+        uploaded = _gemini_files.get(key)
+        if uploaded is None:
+            # Read (and convert if needed) in a worker thread so large
+            # screenshots don't stall the event loop
+            data, mime_type = await asyncio.to_thread(_read_gemini_image, path)
+            try:
+                uploaded = await self.client.aio.files.upload(
+                    file=io.BytesIO(data),
+                    config=types.UploadFileConfig(mime_type=mime_type)
+                )
+            except Exception as e:
+                logger.warning(f"Uploading image {path} to Gemini failed, sending it inline: {str(e)}")
+                return types.Part.from_bytes(data=data, mime_type=mime_type)
+            _gemini_files[key] = uploaded
+        return types.Part.from_uri(file_uri=uploaded.uri, mime_type=uploaded.mime_type)
+
+    async def warm_up(self):
+        """
+        Fetch the model's metadata through the shared client, which leaves a
+        pooled connection open for the first generation request.
+        """
+        try:
+            await self.client.aio.models.get(model=self.model_id)
+        except Exception as e:
+            logger.warning(f"Could not pre-connect to Gemini: {str(e)}")
+
+    def _get_system_prompt(self) -> str:
+        return GEMINI_SYSTEM_PROMPT
+
+    def _prepare_prompt(self, query: str, context: str, image_paths: List[str]) -> str:
+        return GEMINI_PROMPT_TEMPLATE.format(
+            query=query, context=context, image_paths=self._get_image_paths(image_paths)
+        )
+
+    @staticmethod
+    def _get_image_paths(image_paths: List[str]) -> str:
         """Get a formatted string of available image paths."""
-        if not hasattr(self, '_image_paths'):
+        if not image_paths:
             return "No images available"
         
         return "\n".join([
-            f"- {path}" for path in self._image_paths
+            f"- {path}" for path in image_paths
         ])
 
+# Generated answers, shared by all LLMService instances. Exact tier: keyed by
+# provider, query and a digest of the prompt's context and images. Semantic
+# tier: a paraphrased query (cosine >= LLM_CACHE_SIMILARITY) over the same
+# context reuses the answer. Both are keyed on the context digest, so answers
+# over changed search results are never reused. Only used from the event loop.
+_responses: TTLCache = TTLCache(maxsize=1024, ttl=3600)
+_semantic_responses = SemanticCache(capacity=1024, dim=384, threshold=settings.LLM_CACHE_SIMILARITY)
+_response_cache_stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+
+def response_cache_stats() -> Dict[str, int]:
+    """Hit/miss counters and current sizes of the LLM response caches."""
+    return {**_response_cache_stats, "size": len(_responses), "semantic_size": len(_semantic_responses)}
+
+_PROVIDER_CLASSES = {"openai": OpenAIProvider, "gemini": GeminiProvider}
+
+# One instance per provider and process. Providers keep no per-request
+# state, so every LLMService shares them (and their API clients) instead
+# of constructing an SDK client per request.
+_providers: Dict[str, LLMProvider] = {}
+
+async def warm_up_provider(provider: str):
+    """
+    Build the shared provider in a worker thread, then open its API
+    connection, so the first query pays for neither.
+    """
+    service = await asyncio.to_thread(LLMService, provider=provider)
+    await service.provider.warm_up()
+
 class LLMService:
     """Main LLM service that uses the appropriate provider."""
     
     def __init__(self, provider: str = "openai"):
+        self.provider_name = provider.lower()
         self.provider = self._get_provider(provider)
 
     def _get_provider(self, provider: str) -> LLMProvider:
-        if provider.lower() == "openai":
-            return OpenAIProvider()
-        elif provider.lower() == "gemini":
-            return GeminiProvider()
-        else:
-            raise ValueError(f"Unsupported LLM provider: {provider}")
-
-    async def generate_response(self, query: str, search_results: List[Dict]) -> str:
+        name = provider.lower()
+        instance = _providers.get(name)
+        if instance is None:
+            if name not in _PROVIDER_CLASSES:
+                raise ValueError(f"Unsupported LLM provider: {provider}")
+            instance = _providers.setdefault(name, _PROVIDER_CLASSES[name]())
+        return instance
+
+    async def generate_response(
+        self, query: str, search_results: List[Dict], query_embedding: Optional[np.ndarray] = None
+    ) -> str:
         """
         Generate a comprehensive response based on search results.
+        Answers are cached; pass the query's embedding to also reuse the
+        answer to a near-identical query over the same context.
         """
         try:
             # Prepare the context from search results
@@ -349,44 +784,132 @@ class LLMService:
             # Prepare images from search results
             images = self._prepare_images(search_results)
 
+            context_key = self._context_key(context, images)
+            cached = self._cached_response(query, context_key, query_embedding)
+            if cached is not None:
+                return cached
+
             # Generate response using the selected provider
-            return await self.provider.generate_response(query, context, images)
+            response = await self.provider.generate_response(query, context, images)
+            self._remember_response(query, context_key, query_embedding, response)
+            return response
 
         except Exception as e:
             logger.error(f"Error generating LLM response: {str(e)}")
             raise
 
+    async def stream_response(
+        self, query: str, search_results: List[Dict], query_embedding: Optional[np.ndarray] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the response to a query as it is generated, so callers can
+        forward the first tokens before the model has finished. A cached
+        answer is yielded in one piece; a streamed one is cached once complete.
+        """
+        context = self._prepare_context(search_results)
+        images = self._prepare_images(search_results)
+        context_key = self._context_key(context, images)
+        cached = self._cached_response(query, context_key, query_embedding)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        async for text in self.provider.stream_response(query, context, images):
+            parts.append(text)
+            yield text
+        self._remember_response(query, context_key, query_embedding, "".join(parts))
+
+    async def generate_responses_batch(self, queries: List[Dict]) -> List[Optional[str]]:
+        """
+        Generate responses for many queries through the OpenAI Batch API, at
+        half the realtime price; for offline work such as pre-generating
+        answers over a corpus, since a batch can take up to 24 hours.
+        Each item has a query and its search_results. Responses are returned
+        in order, with None for requests the batch failed to answer.
+        """
+        if not isinstance(self.provider, OpenAIProvider):
+            raise ValueError(f"Batch generation is not supported by LLM provider: {self.provider_name}")
+
+        responses: List[Optional[str]] = [None] * len(queries)
+        requests = []
+        context_keys = []
+        for i, item in enumerate(queries):
+            context = self._prepare_context(item['search_results'])
+            images = self._prepare_images(item['search_results'])
+            context_key = self._context_key(context, images)
+            context_keys.append(context_key)
+            responses[i] = self._cached_response(item['query'], context_key, None)
+            if responses[i] is None:
+                requests.append({"custom_id": str(i), "query": item['query'], "context": context, "images": images})
+
+        if requests:
+            batch_id = await self.provider.submit_batch(requests)
+            for custom_id, response in (await self.provider.await_batch(batch_id)).items():
+                i = int(custom_id)
+                responses[i] = response
+                self._remember_response(queries[i]['query'], context_keys[i], None, response)
+        return responses
+
+    def _context_key(self, context: str, images: List[Dict]) -> str:
+        """Digest identifying the provider, context and images of a prompt."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(self.provider_name.encode())
+        digest.update(b"\0" + context.encode())
+        for img in images:
+            digest.update(b"\0" + img['path'].encode())
+        return digest.hexdigest()
+
+    def _cached_response(self, query: str, context_key: str, query_embedding: Optional[np.ndarray]) -> Optional[str]:
+        response = _responses.get((query, context_key))
+        outcome = "hits"
+        if response is None and query_embedding is not None:
+            response = _semantic_responses.get(query_embedding, context_key)
+            outcome = "semantic_hits"
+        if response is None:
+            _response_cache_stats["misses"] += 1
+            return None
+        _response_cache_stats[outcome] += 1
+        logger.info(f"LLM response cache hit for query: {query}")
+        return response
+
+    def _remember_response(self, query: str, context_key: str, query_embedding: Optional[np.ndarray], response: str):
+        _responses[(query, context_key)] = response
+        if query_embedding is not None:
+            _semantic_responses.put(query_embedding, context_key, response)
+
     def _prepare_context(self, search_results: List[Dict]) -> str:
         """
         Prepare the context from search results in a format suitable for the LLM.
+        Each section (heading and content) is formatted in one step and the
+        sections are joined once.
         """
-        context_parts = []
-        
-        for group in search_results:
-            # Add the main context (high similarity match)
-            if group.get('context'):
-                context_parts.append(f"\nMain Context (Page {group['context']['metadata']['page_number']}):")
-                context_parts.append(group['context']['content'])
-            
-            # Add related pages
-            if group.get('pages'):
-                for page in group['pages']:
-                    context_parts.append(f"\nRelated Page {page['metadata']['page_number']}:")
-                    context_parts.append(page['content'])
-        
-        return "\n".join(context_parts)
+        def sections():
+            for group in search_results:
+                # Add the main context (high similarity match)
+                context = group.get('context')
+                if context:
+                    yield f"\nMain Context (Page {context['metadata']['page_number']}):\n{context['content']}"
+
+                # Add related pages
+                for page in group.get('pages') or ():
+                    yield f"\nRelated Page {page['metadata']['page_number']}:\n{page['content']}"
+
+        return "\n".join(sections())
 
     def _prepare_images(self, search_results: List[Dict]) -> List[Dict]:
         """
-        Prepare images from search results.
+        Prepare images from search results, each image once (a page can be
+        both a group's context and one of its pages), keeping the page
+        number where it first appears.
         """
-        images = []
+        images: Dict[str, Dict] = {}
         
         for group in search_results:
             # Process images from main context
             if group.get('context') and group['context'].get('images'):
                 for img in group['context']['images']:
-                    images.append({
+                    images.setdefault(img['path'], {
                         "path": img['path'],
                         "page_number": group['context']['metadata']['page_number']
                     })
@@ -396,9 +919,9 @@ class LLMService:
                 for page in group['pages']:
                     if page.get('images'):
                         for img in page['images']:
-                            images.append({
+                            images.setdefault(img['path'], {
                                 "path": img['path'],
                                 "page_number": page['metadata']['page_number']
                             })
         
-        return images 
\ No newline at end of file
+        return list(images.values()) 
\ No newline at end of file
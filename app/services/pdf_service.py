@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 from app.processors.pdf_processor import PDFProcessor
 from app.models.document import Document
+from app.crud import document as crud_document
 from sqlalchemy.orm import Session
 import logging
 
@@ -52,6 +53,7 @@ class PDFService:
             if not document.title and content["metadata"].get("title"):
                 document.title = content["metadata"]["title"]
                 self.db.commit()
+                crud_document.invalidate_document(document)
             
             logger.info(f"Successfully processed document {document_id}")
             return result
@@ -0,0 +1,36 @@
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Optional, only speeds up scoring of small key sets
+    njit = None
+
+def _dot_batch(q: np.ndarray, keys: np.ndarray, out: np.ndarray) -> None:
+    for i in range(keys.shape[0]):
+        s = 0.0
+        for j in range(keys.shape[1]):
+            s += q[j] * keys[i, j]
+        out[i] = s
+
+if njit is not None:
+    # Single-threaded on purpose: key sets are small, and a parallel kernel
+    # would compete with the event loop and embedding threads
+    _dot_batch = njit(cache=True, fastmath=True)(_dot_batch)
+
+def cosine_batch(q: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """
+    Cosine similarity of q against every row of keys. Both must be unit
+    length float32, so the similarity is a dot product. Uses the numba
+    kernel when numba is installed, which avoids BLAS dispatch overhead on
+    the few hundred rows a cache holds; NumPy otherwise.
+    """
+    if njit is None:
+        return keys @ q
+    out = np.empty(keys.shape[0], dtype=np.float32)
+    _dot_batch(q, keys, out)
+    return out
+
+def warm_up() -> None:
+    """Compile the numba kernel ahead of the first request (no-op without numba)."""
+    if njit is not None:
+        cosine_batch(np.zeros(1, dtype=np.float32), np.zeros((1, 1), dtype=np.float32))
\ No newline at end of file
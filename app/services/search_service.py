@@ -1,18 +1,60 @@
 from typing import List, Dict, Optional
+import numpy as np
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.services.embedding_service import EmbeddingService
+from app.services.semantic_cache import SemanticCache
+from app.config import settings
 import logging
 import json
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
 
+# pgvector's default hnsw.ef_search; larger limits scale the candidate list up
+HNSW_MIN_EF_SEARCH = 40
+
+# First search stage when SEARCH_RERANK_OVERSAMPLE is set: nearest chunks by
+# Hamming distance between sign bits (ix_chunks_embedding_bq_hnsw), which
+# initial_matches then reranks by exact cosine distance
+BINARY_CANDIDATES_CTE = """
+            candidates AS (
+                SELECT dc.*
+                FROM document_chunks dc
+                JOIN documents d ON d.id = dc.document_id
+                WHERE dc.embedding IS NOT NULL
+                {filter_clause}
+                ORDER BY binary_quantize(dc.embedding)::bit(384)
+                    <~> binary_quantize(CAST(:embedding AS halfvec(384)))::bit(384)
+                LIMIT :candidates
+            ),
+"""
+
+# Rows fetched per round trip when streaming search results
+STREAM_BATCH_SIZE = 500
+
+# Results of recent searches, reused for near-duplicate queries.
+# Cleared whenever new chunks are stored in this process; entries expire after
+# SEARCH_CACHE_TTL_SECONDS so other workers pick the new chunks up too.
+search_cache = SemanticCache(
+    capacity=1024, dim=384, threshold=0.95, ttl=settings.SEARCH_CACHE_TTL_SECONDS
+)
+
 class SearchService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.embedding_service = EmbeddingService()
 
+    async def embed_query(self, query: str) -> np.ndarray:
+        """
+        Create the query embedding off the event loop (model inference is CPU-bound).
+        Exposed separately so callers can overlap it with other startup work.
+        Returns a contiguous float32 array, which binds directly as a pgvector value.
+        Repeated queries are served from EmbeddingService's query cache, and
+        concurrent ones are encoded in a shared batch.
+        """
+        return await self.embedding_service.embed_query_batched(query)
+
     async def search(
         self,
         query: str,
@@ -20,61 +62,29 @@ class SearchService:
         threshold: float = 0.3,
         document_id: Optional[int] = None,
         product_id: Optional[int] = None,
-        context_pages: int = 3  # Number of pages to include before and after a match
+        context_pages: int = 3,  # Number of pages to include before and after a match
+        query_embedding: Optional[np.ndarray] = None  # Precomputed via embed_query()
     ) -> List[Dict]:
         """
         Search for similar content using vector similarity and include context pages.
         Can filter by document_id or product_id.
         """
         try:
-            # Debug: Check all documents and their vectorization status
-            debug_sql = """
-            SELECT 
-                d.id as document_id,
-                d.filename,
-                COUNT(dc.id) as total_chunks,
-                COUNT(CASE WHEN dc.embedding IS NOT NULL THEN 1 END) as vectorized_chunks
-            FROM documents d
-            LEFT JOIN document_chunks dc ON d.id = dc.document_id
-            GROUP BY d.id, d.filename
-            ORDER BY d.id
-            """
-            debug_results = self.db.execute(text(debug_sql)).fetchall()
-            for row in debug_results:
-                logger.info(f"Document {row.document_id} ({row.filename}): {row.total_chunks} total chunks, {row.vectorized_chunks} vectorized chunks")
-
-            # Debug: Check if document exists and has chunks
-            if document_id:
-                doc_sql = """
-                SELECT 
-                    COUNT(*) as total_chunks,
-                    COUNT(CASE WHEN embedding IS NOT NULL THEN 1 END) as vectorized_chunks
-                FROM document_chunks
-                WHERE document_id = :document_id
-                """
-                doc_result = self.db.execute(text(doc_sql), {"document_id": document_id}).first()
-                logger.info(f"Searching document {document_id}: {doc_result.total_chunks} total chunks, {doc_result.vectorized_chunks} vectorized chunks")
-
-            # Create query embedding
-            query_embedding = self.embedding_service.create_embeddings(query)
+            # Create query embedding unless the caller already has it
+            if query_embedding is None:
+                query_embedding = await self.embed_query(query)
             logger.info(f"Created query embedding of length: {len(query_embedding)}")
 
-            # Debug: Check a sample embedding from the database
-            sample_sql = """
-            SELECT embedding 
-            FROM document_chunks 
-            WHERE document_id = :document_id AND embedding IS NOT NULL 
-            LIMIT 1
-            """
-            sample_result = self.db.execute(text(sample_sql), {"document_id": document_id}).first()
-            if sample_result:
-                logger.info(f"Sample embedding length from DB: {len(sample_result.embedding)}")
-            else:
-                logger.warning("No vectorized chunks found in database")
+            # Serve near-duplicate queries with the same filters from the cache
+            cache_params = (document_id, product_id, limit, threshold, context_pages)
+            cached_results = search_cache.get(query_embedding, cache_params)
+            if cached_results is not None:
+                logger.info(f"Semantic cache hit for query: {query}")
+                return cached_results
 
             # Build SQL query to find initial matches
             sql = """
-            WITH initial_matches AS (
+            WITH {candidates_cte}initial_matches AS (
                 SELECT 
                     dc.id,
                     dc.document_id,
@@ -83,33 +93,45 @@ class SearchService:
                     d.filename,
                     d.version,
                     d.product_id,
-                    1 - (dc.embedding <=> CAST(:embedding AS vector(384))) as similarity,
+                    1 - (dc.embedding <=> :embedding) as similarity,
                     (dc.chunk_metadata->>'page_number')::int as page_number
-                FROM document_chunks dc
+                FROM {chunk_source} dc
                 JOIN documents d ON d.id = dc.document_id
-                WHERE 1 - (dc.embedding <=> CAST(:embedding AS vector(384))) > :threshold
+                WHERE dc.embedding <=> :embedding < :max_distance
                 {filter_clause}
-                ORDER BY similarity DESC
+                ORDER BY dc.embedding <=> :embedding
                 LIMIT :limit
             ),
             context_chunks AS (
+                -- Per match, only the chunks on the surrounding pages: one range
+                -- scan of ix_document_chunks_document_page each, instead of joining
+                -- every chunk of the matched documents and filtering afterwards.
+                -- They belong to the matched document, so they already satisfy
+                -- the filters and share its document columns.
                 SELECT 
                     dc.id,
                     dc.document_id,
                     dc.content,
                     dc.chunk_metadata,
-                    d.filename,
-                    d.version,
-                    d.product_id,
-                    (dc.chunk_metadata->>'page_number')::int as page_number,
+                    im.filename,
+                    im.version,
+                    im.product_id,
+                    dc.page_number,
                     im.similarity as original_similarity
-                FROM document_chunks dc
-                JOIN documents d ON d.id = dc.document_id
-                JOIN initial_matches im ON dc.document_id = im.document_id
-                WHERE (dc.chunk_metadata->>'page_number')::int 
-                    BETWEEN (im.page_number - :context_pages) 
-                    AND (im.page_number + :context_pages)
-                {filter_clause}
+                FROM initial_matches im
+                CROSS JOIN LATERAL (
+                    SELECT 
+                        c.id,
+                        c.document_id,
+                        c.content,
+                        c.chunk_metadata,
+                        (c.chunk_metadata->>'page_number')::int as page_number
+                    FROM document_chunks c
+                    WHERE c.document_id = im.document_id
+                    AND (c.chunk_metadata->>'page_number')::int 
+                        BETWEEN (im.page_number - :context_pages) 
+                        AND (im.page_number + :context_pages)
+                ) dc
             )
             SELECT 
                 cc.*,
@@ -119,7 +141,7 @@ class SearchService:
                             'filename', i.data->>'filename',
                             'path', i.data->>'path'
                         ))
-                        FROM json_array_elements(cc.chunk_metadata->'images') as i(data)
+                        FROM jsonb_array_elements(cc.chunk_metadata->'images') as i(data)
                         WHERE i.data->>'filename' IS NOT NULL
                     ),
                     '[]'::json
@@ -130,7 +152,7 @@ class SearchService:
                             'filename', t.data->>'filename',
                             'path', t.data->>'path'
                         ))
-                        FROM json_array_elements(cc.chunk_metadata->'tables') as t(data)
+                        FROM jsonb_array_elements(cc.chunk_metadata->'tables') as t(data)
                         WHERE t.data->>'filename' IS NOT NULL
                     ),
                     '[]'::json
@@ -142,33 +164,57 @@ class SearchService:
             # Build filter clause and parameters
             params = {
                 "embedding": query_embedding,
-                "threshold": threshold,
+                # Bound as a float; in "1 - :threshold" Postgres would type the
+                # parameter as an integer and asyncpg would reject 0.3
+                "max_distance": 1 - threshold,
                 "limit": limit,
                 "context_pages": context_pages,
             }
             filter_clause = ""
             if document_id:
-                filter_clause = "AND d.document_id = :document_id"
+                filter_clause = "AND dc.document_id = :document_id"
                 params["document_id"] = document_id
             elif product_id:
                 filter_clause = "AND d.product_id = :product_id"
                 params["product_id"] = product_id
 
+            # Oversample candidates from the binary index, then rerank them exactly
+            oversample = settings.SEARCH_RERANK_OVERSAMPLE
+            candidates_cte = ""
+            chunk_source = "document_chunks"
+            if oversample > 0:
+                candidates_cte = BINARY_CANDIDATES_CTE
+                chunk_source = "candidates"
+                params["candidates"] = limit * oversample
+
             # Add filter clause to SQL
-            sql = sql.format(filter_clause=filter_clause)
+            sql = sql.format(
+                candidates_cte=candidates_cte.format(filter_clause=filter_clause),
+                chunk_source=chunk_source,
+                filter_clause=filter_clause
+            )
 
-            # Log the complete query with parameters for manual testing
-            test_query = sql.replace(":embedding", f"'{query_embedding}'::vector")
-            test_query = test_query.replace(":threshold", str(threshold))
-            test_query = test_query.replace(":limit", str(limit))
-            if document_id:
-                test_query = test_query.replace(":document_id", str(document_id))
-            elif product_id:
-                test_query = test_query.replace(":product_id", str(product_id))
-            #logger.info("Complete SQL query for manual testing:\n" + test_query)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"Vector search: limit={limit}, threshold={threshold}, "
+                    f"document_id={document_id}, product_id={product_id}, oversample={oversample}"
+                )
+
+            # Size the HNSW candidate list for this request; is_local=true scopes it
+            # to the current transaction like SET LOCAL (which can't take parameters)
+            await self.db.execute(
+                text("SELECT set_config('hnsw.ef_search', :ef_search, true)"),
+                {"ef_search": str(max(params.get("candidates", limit * 4), HNSW_MIN_EF_SEARCH))}
+            )
 
-            # Execute query
-            result = self.db.execute(text(sql), params)
+            # Execute query; the float32 array is sent through pgvector's binary codec
+            # (as halfvec, the type Postgres infers from the column).
+            # Ordering by raw distance lets the HNSW index drive the LIMIT.
+            # Context pages can fan out to many rows, so stream them through a
+            # server-side cursor instead of buffering the whole result.
+            result = await self.db.stream(
+                text(sql), params, execution_options={"yield_per": STREAM_BATCH_SIZE}
+            )
 
             # Process results and group by context
             results = []
@@ -177,7 +223,7 @@ class SearchService:
             seen_chunks = set()  # Track seen chunk IDs to avoid duplicates
             seen_images = set()  # Track seen image filenames
 
-            for row in result:
+            async for row in result:
                 # Skip if we've already seen this chunk
                 if row.id in seen_chunks:
                     continue
@@ -251,6 +297,7 @@ class SearchService:
             logger.info(f"Total unique pages: {sum(len(group['pages']) for group in results)}")
             logger.info(f"Total unique images: {len(seen_images)}")
 
+            search_cache.put(query_embedding, cache_params, results)
             return results
 
         except Exception as e:
@@ -275,30 +322,31 @@ class SearchService:
             FROM documents 
             WHERE id = :document_id
             """
-            doc_result = self.db.execute(text(doc_sql), {"document_id": document_id}).first()
+            doc_result = (await self.db.execute(text(doc_sql), {"document_id": document_id})).first()
             if not doc_result:
                  raise ValueError(f"Document with ID {document_id} not found.")
             source_product_id = doc_result.product_id
             logger.info(f"Searching region from document ID {document_id} (Product ID: {source_product_id})")
             
             # Step 2: Find the chunk content that contains this region
+            # (containment on chunk_metadata lets Postgres use the GIN index)
             chunk_sql = """
             SELECT content
             FROM document_chunks
             WHERE document_id = :document_id
-            AND (chunk_metadata->>'page_number')::int = :page_number
-            AND chunk_metadata->>'bbox' @> CAST(:bbox AS jsonb)
+            AND chunk_metadata @> CAST(:page_filter AS jsonb)
+            AND chunk_metadata->'bbox' @> CAST(:bbox AS jsonb)
             LIMIT 1
             """
             
-            chunk_result = self.db.execute(
+            chunk_result = (await self.db.execute(
                 text(chunk_sql),
                 {
                     "document_id": document_id,
-                    "page_number": page_number,
+                    "page_filter": json.dumps({"page_number": page_number}),
                     "bbox": json.dumps(bbox) # Ensure bbox is proper JSON string for query
                 }
-            ).first()
+            )).first()
 
             if not chunk_result or not chunk_result.content:
                 logger.warning(f"No content found for region in doc {document_id}, page {page_number}, bbox {bbox}")
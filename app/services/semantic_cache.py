@@ -0,0 +1,80 @@
+from typing import Any, Hashable, List, Optional
+import threading
+import time
+import numpy as np
+from app.services.scorer import cosine_batch
+
+class SemanticCache:
+    """
+    Cache of recent search results keyed by query embedding.
+
+    A lookup returns the results of a cached query whose embedding has cosine
+    similarity >= threshold with the new one (and the same search parameters),
+    so near-duplicate queries skip the database. Keys are kept in one
+    contiguous (capacity, dim) float32 matrix so a lookup is a single pass
+    of scorer.cosine_batch; the least recently used entry is evicted when full.
+    With a ttl (seconds), entries older than that are no longer returned.
+    Embeddings must be unit length, as produced by EmbeddingService.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        dim: int = 384,
+        threshold: float = 0.95,
+        ttl: Optional[float] = None
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl = ttl
+        self._keys = np.zeros((capacity, dim), dtype=np.float32)
+        self._params: List[Optional[Hashable]] = [None] * capacity
+        self._values: List[Any] = [None] * capacity
+        self._last_used = np.zeros(capacity, dtype=np.int64)
+        self._expires = np.full(capacity, np.inf)
+        self._size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    def get(self, embedding: np.ndarray, params: Hashable) -> Optional[Any]:
+        """Return cached results for a similar query with the same params, or None."""
+        with self._lock:
+            if self._size == 0:
+                return None
+            similarities = cosine_batch(embedding, self._keys[:self._size])
+            now = time.monotonic()
+            for slot in np.argsort(similarities)[::-1]:
+                if similarities[slot] < self.threshold:
+                    break
+                if self._params[slot] == params and self._expires[slot] > now:
+                    self._clock += 1
+                    self._last_used[slot] = self._clock
+                    return self._values[slot]
+            return None
+
+    def put(self, embedding: np.ndarray, params: Hashable, value: Any):
+        """Cache value for this query, evicting the least recently used entry if full."""
+        with self._lock:
+            if self._size < self.capacity:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._keys[slot] = embedding
+            self._params[slot] = params
+            self._values[slot] = value
+            self._expires[slot] = np.inf if self.ttl is None else time.monotonic() + self.ttl
+            self._clock += 1
+            self._last_used[slot] = self._clock
+
+    def clear(self):
+        """Drop every entry, e.g. after new chunks have been indexed."""
+        with self._lock:
+            self._params = [None] * self.capacity
+            self._values = [None] * self.capacity
+            self._last_used[:] = 0
+            self._expires[:] = np.inf
+            self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
\ No newline at end of file
@@ -1,18 +1,71 @@
+from sqlalchemy import text
+from sentence_transformers import SentenceTransformer
 from sqlalchemy.orm import Session
 from app.models.document_chunk import DocumentChunk
 from app.models.document import Document
-from sentence_transformers import SentenceTransformer
+from app.crud import document_chunk as crud_chunk
+from app.services.search_service import search_cache
+from app.services.embedding_service import load_embedding_model
+from app.config import settings
+import asyncio
 import json
 import logging
+import threading
 from typing import List, Dict, Union, Any
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# ANN indexes on document_chunks.embedding, keyed by name. Both are dropped
+# for bulk loads and rebuilt afterwards (same definitions as the migrations).
+EMBEDDING_INDEXES = {
+    "ix_chunks_embedding_hnsw": """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_embedding_hnsw
+ON document_chunks USING hnsw (embedding halfvec_cosine_ops)
+WITH (m = 16, ef_construction = 64)
+""",
+    "ix_chunks_embedding_bq_hnsw": """
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_embedding_bq_hnsw
+ON document_chunks USING hnsw ((binary_quantize(embedding)::bit(384)) bit_hamming_ops)
+""",
+}
+
+# Number of chunk rows buffered before each COPY into document_chunks;
+# each buffer is embedded with a single encode() call
+COPY_BATCH_SIZE = 1000
+
+# Texts per forward pass of the embedding model
+EMBEDDING_BATCH_SIZE = 256
+
+# Long-lived embedding worker processes (EMBEDDING_PROCESSES), started on
+# first use and shared by every VectorService so workers are spawned once
+# per application, not per document or batch
+_encode_pool = None
+_encode_pool_lock = threading.Lock()
+
+def _get_encode_pool(model) -> Dict[str, Any]:
+    global _encode_pool
+    with _encode_pool_lock:
+        if _encode_pool is None:
+            # Move the weights to shared memory first; torch.multiprocessing
+            # then hands workers a handle to them instead of a pickled copy
+            model.share_memory()
+            _encode_pool = model.start_multi_process_pool(["cpu"] * settings.EMBEDDING_PROCESSES)
+            logger.info(f"Started {settings.EMBEDDING_PROCESSES} embedding worker processes")
+        return _encode_pool
+
+def stop_encode_pool():
+    """Terminate the embedding worker processes, if they were started."""
+    global _encode_pool
+    with _encode_pool_lock:
+        if _encode_pool is not None:
+            SentenceTransformer.stop_multi_process_pool(_encode_pool)
+            _encode_pool = None
+
 class VectorService:
     def __init__(self, db: Session):
         self.db = db
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model = load_embedding_model('all-MiniLM-L6-v2')
         self.embedding_dim = 384  # Fixed dimension for the model
 
     async def vectorize_document(self, document_id: int) -> Dict:
@@ -32,62 +85,47 @@ class VectorService:
                 content = json.load(f)
 
             chunks_created = 0
+            pending_rows = []
             # Process each page
             for page in content['pages']:
+                # Image references are the same for every text block with a
+                # bbox, so build them once per page and share the list
+                page_images = [
+                    {
+                        'filename': img.get('filename'),
+                        'path': img.get('path')
+                    } for img in page.get('images', [])
+                    if img.get('type') == 'image'  # Ensure it's an image
+                ]
+
                 # Process text blocks
                 for text_block in page['text']:
                     if not text_block.get('text'):
                         continue
 
-                    # Create embedding for text
-                    embedding = self.model.encode(text_block['text'])
-                    
-                    # Ensure embedding is the correct dimension and normalized
-                    if len(embedding) != self.embedding_dim:
-                        logger.warning(f"Embedding dimension mismatch: expected {self.embedding_dim}, got {len(embedding)}")
-                        # Truncate or pad if necessary
-                        if len(embedding) > self.embedding_dim:
-                            embedding = embedding[:self.embedding_dim]
-                        else:
-                            embedding = np.pad(embedding, (0, self.embedding_dim - len(embedding)))
-                    
-                    # Normalize the embedding
-                    embedding = embedding / np.linalg.norm(embedding)
-                    
-                    # Convert to list for storage
-                    embedding = embedding.tolist()
-
                     # Get nearby images and tables
                     nearby_images = []
                     nearby_tables = []
 
                     if isinstance(text_block.get('bbox'), (list, tuple)):
                         # Only look for nearby elements if we have valid bbox
-                        nearby_images = [
-                            img for img in page.get('images', [])
-                            if img.get('type') == 'image'  # Ensure it's an image
-                        ]
+                        nearby_images = page_images
                         nearby_tables = [
                             table for table in page.get('tables', [])
                             if isinstance(table.get('bbox'), (list, tuple)) and 
                             self._is_nearby(text_block['bbox'], table['bbox'])
                         ]
 
-                    # Create chunk record
-                    chunk = DocumentChunk(
-                        document_id=document_id,
-                        content=text_block['text'],
-                        embedding=embedding,
-                        chunk_metadata={
+                    # Queue chunk row for the next COPY
+                    pending_rows.append({
+                        'document_id': document_id,
+                        'content': text_block['text'],
+                        'embedding': None,  # Filled in per batch by _embed_rows
+                        'chunk_metadata': {
                             'page_number': page['page_number'],
                             'bbox': text_block.get('bbox'),
                             'type': 'text',
-                            'images': [
-                                {
-                                    'filename': img.get('filename'),
-                                    'path': img.get('path')
-                                } for img in nearby_images
-                            ],
+                            'images': nearby_images,
                             'tables': [
                                 {
                                     'filename': table.get('filename'),
@@ -95,16 +133,21 @@ class VectorService:
                                 } for table in nearby_tables
                             ]
                         }
-                    )
-                    self.db.add(chunk)
-                    chunks_created += 1
+                    })
 
-                    # Commit in batches to avoid memory issues
-                    if chunks_created % 100 == 0:
-                        self.db.commit()
+                    # Embed and stream rows in batches to keep memory bounded
+                    if len(pending_rows) >= COPY_BATCH_SIZE:
+                        await self._embed_rows(pending_rows)
+                        chunks_created += await asyncio.to_thread(self._insert_chunks, pending_rows)
+                        pending_rows = []
 
-            # Final commit for remaining chunks
-            self.db.commit()
+            # Copy remaining rows and commit the whole document at once; the
+            # inserts and commit run in a worker thread, off the event loop
+            await self._embed_rows(pending_rows)
+            chunks_created += await asyncio.to_thread(self._insert_chunks, pending_rows)
+            await asyncio.to_thread(self.db.commit)
+            # Cached search results don't include the new chunks
+            search_cache.clear()
             logger.info(f"Created {chunks_created} vector embeddings for document {document_id}")
 
             return {
@@ -118,6 +161,110 @@ class VectorService:
             logger.error(f"Error creating vector embeddings: {str(e)}")
             raise
 
+    async def _embed_rows(self, rows: List[Dict]):
+        """
+        Fill in the embeddings of a batch of chunk rows. Texts that are
+        already stored (re-uploaded revisions, boilerplate repeated across
+        pages) reuse their embedding; each remaining distinct text is encoded
+        once, with one batched encode() call run in a worker thread so it
+        doesn't block the event loop.
+        """
+        if not rows:
+            return
+        contents = list(dict.fromkeys(row['content'] for row in rows))
+        embeddings = crud_chunk.get_embeddings_by_content(self.db, contents)
+        missing = [content for content in contents if content not in embeddings]
+        if missing:
+            encoded = await asyncio.to_thread(self._embed_texts, missing)
+            embeddings.update(zip(missing, encoded))
+        logger.debug(f"Embedded {len(missing)} of {len(rows)} chunks, reused {len(contents) - len(missing)} stored embeddings")
+        for row in rows:
+            row['embedding'] = embeddings[row['content']]
+
+    def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """Encode texts into unit-length float32 embeddings, one row per text."""
+        # Create embeddings as float32; Postgres rounds them to fp16 when storing the halfvec
+        # normalize_embeddings L2-normalizes inside encode(), on the model's tensors
+        if settings.EMBEDDING_PROCESSES > 0:
+            # Split the texts across the worker pool; each worker holds its own model copy
+            embeddings = self.model.encode_multi_process(
+                texts,
+                _get_encode_pool(self.model),
+                batch_size=EMBEDDING_BATCH_SIZE,
+                normalize_embeddings=True
+            )
+        else:
+            embeddings = self.model.encode(
+                texts,
+                batch_size=EMBEDDING_BATCH_SIZE,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+        embeddings = embeddings.astype(np.float32, copy=False)
+
+        # Ensure embeddings are the correct dimension
+        dim = embeddings.shape[1]
+        if dim != self.embedding_dim:
+            logger.warning(f"Embedding dimension mismatch: expected {self.embedding_dim}, got {dim}")
+            # Truncate or pad if necessary, then restore unit length
+            if dim > self.embedding_dim:
+                embeddings = embeddings[:, :self.embedding_dim]
+            else:
+                embeddings = np.pad(embeddings, ((0, 0), (0, self.embedding_dim - dim)))
+            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+        return embeddings
+
+    def _insert_chunks(self, rows: List[Dict]) -> int:
+        """Persist chunk rows with COPY, or batched INSERTs if the driver lacks COPY."""
+        if crud_chunk.supports_copy(self.db):
+            return crud_chunk.copy_chunks(self.db, rows)
+        return crud_chunk.bulk_create_chunks(self.db, rows)
+
+    def drop_embedding_index(self):
+        """
+        Drop the HNSW embedding indexes before a bulk load so inserts
+        don't pay for graph maintenance row by row.
+        """
+        for name in EMBEDDING_INDEXES:
+            self._execute_autocommit(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            logger.info(f"Dropped embedding index {name}")
+
+    def create_embedding_index(self):
+        """
+        (Re)build the HNSW embedding indexes concurrently, without blocking
+        reads or writes on document_chunks.
+        A failed or cancelled concurrent build leaves an INVALID index behind,
+        which IF NOT EXISTS would keep; such an index is dropped and rebuilt.
+        """
+        for name, ddl in EMBEDDING_INDEXES.items():
+            if self._is_invalid_index(name):
+                logger.warning(f"Embedding index {name} is invalid, rebuilding it")
+                self._execute_autocommit(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            self._execute_autocommit(ddl)
+            logger.info(f"Created embedding index {name}")
+
+    def _is_invalid_index(self, name: str) -> bool:
+        """
+        Whether the index exists but is marked invalid (pg_index.indisvalid).
+        Checked on its own autocommit connection: an open transaction on the
+        session would make the concurrent build wait for it.
+        """
+        with self.db.get_bind().connect() as conn:
+            return bool(conn.execution_options(isolation_level="AUTOCOMMIT").execute(
+                text(
+                    "SELECT NOT i.indisvalid FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"
+                ),
+                {"name": name}
+            ).scalar())
+
+    def _execute_autocommit(self, sql: str):
+        """Run a statement that can't be executed inside a transaction block."""
+        with self.db.get_bind().connect() as conn:
+            conn.execution_options(isolation_level="AUTOCOMMIT").execute(text(sql))
+
     def _is_nearby(self, bbox1: Union[List[float], tuple], bbox2: Union[List[float], tuple], threshold: float = 100) -> bool:
         """
         Check if two bounding boxes are near each other.
@@ -19,6 +19,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from app.models.document import Document
 from app.models.document_chunk import DocumentChunk
 from app.database import Base
+from app.config import settings
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -33,7 +34,8 @@ config.set_main_option('DB_NAME', os.getenv('DB_NAME'))
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-if config.config_file_name is not None:
+# Skipped when the app runs migrations itself, so its loggers stay configured.
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
     fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
@@ -81,6 +83,8 @@ def run_migrations_online() -> None:
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
+        # Give up on a blocked DDL lock rather than stalling queries queued behind it
+        connect_args={"options": f"-c lock_timeout={settings.MIGRATION_LOCK_TIMEOUT}"},
     )
 
     with connectable.connect() as connection:
@@ -0,0 +1,37 @@
+"""rename document_chunks.metadata to chunk_metadata
+
+Revision ID: 19a730a219da
+Revises: 4075afdeef1d
+Create Date: 2026-10-15 11:27:05.640118
+
+"metadata" collides with the declarative Base.metadata attribute, so the
+model maps the column as chunk_metadata. Databases created through the
+original add_document_chunks migration still have the old name; tables
+created by Base.metadata.create_all() already use the new one.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '19a730a219da'
+down_revision: Union[str, None] = '4075afdeef1d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _column_names() -> set:
+    inspector = sa.inspect(op.get_bind())
+    return {column['name'] for column in inspector.get_columns('document_chunks')}
+
+
+def upgrade() -> None:
+    if 'metadata' in _column_names():
+        op.alter_column('document_chunks', 'metadata', new_column_name='chunk_metadata')
+
+
+def downgrade() -> None:
+    if 'chunk_metadata' in _column_names():
+        op.alter_column('document_chunks', 'chunk_metadata', new_column_name='metadata')
@@ -0,0 +1,37 @@
+"""add chunk content hash index
+
+Revision ID: 20658fc9ecf8
+Revises: fd1b6890c6d8
+Create Date: 2026-10-15 12:20:41.873102
+
+Expression index on md5(content), used by VectorService to reuse the stored
+embedding of chunks whose text was already embedded instead of encoding
+it again.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '20658fc9ecf8'
+down_revision: Union[str, None] = 'fd1b6890c6d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_document_chunks_content_md5', 'document_chunks',
+                   [sa.text('md5(content)')],
+                   unique=False,
+                   postgresql_concurrently=True,
+                   if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_document_chunks_content_md5', table_name='document_chunks',
+                   postgresql_concurrently=True,
+                   if_exists=True)
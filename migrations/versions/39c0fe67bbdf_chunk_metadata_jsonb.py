@@ -0,0 +1,47 @@
+"""store chunk metadata as jsonb with a gin index
+
+Revision ID: 39c0fe67bbdf
+Revises: 19a730a219da
+Create Date: 2026-10-15 10:03:17.502961
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '39c0fe67bbdf'
+down_revision: Union[str, None] = '19a730a219da'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column('document_chunks', 'chunk_metadata',
+               existing_type=postgresql.JSON(),
+               type_=postgresql.JSONB(astext_type=sa.Text()),
+               existing_nullable=False,
+               postgresql_using='chunk_metadata::jsonb')
+
+    # Serves containment filters such as chunk_metadata @> '{"page_number": 3}'
+    with op.get_context().autocommit_block():
+        op.create_index('ix_chunks_metadata_gin', 'document_chunks', ['chunk_metadata'],
+                   unique=False,
+                   postgresql_using='gin',
+                   postgresql_ops={'chunk_metadata': 'jsonb_path_ops'},
+                   postgresql_concurrently=True,
+                   if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_chunks_metadata_gin', table_name='document_chunks',
+                   postgresql_concurrently=True,
+                   if_exists=True)
+    op.alter_column('document_chunks', 'chunk_metadata',
+               existing_type=postgresql.JSONB(astext_type=sa.Text()),
+               type_=postgresql.JSON(),
+               existing_nullable=False,
+               postgresql_using='chunk_metadata::json')
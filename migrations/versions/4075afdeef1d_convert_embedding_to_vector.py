@@ -0,0 +1,65 @@
+"""convert document chunk embeddings to pgvector
+
+Revision ID: 4075afdeef1d
+Revises: f1c42e2394d7
+Create Date: 2026-10-15 09:12:41.118204
+
+The column type change runs in the normal migration transaction. The HNSW
+index is built afterwards with CREATE INDEX CONCURRENTLY inside an
+autocommit block, so it does not hold an ACCESS EXCLUSIVE lock on
+document_chunks while the graph is built and the API can keep serving.
+
+For large ingests the index should be built after the data is loaded: use
+POST /admin/vectorize, which drops the index, inserts all chunks and then
+rebuilds it concurrently.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from pgvector.sqlalchemy import Vector
+
+# revision identifiers, used by Alembic.
+revision: str = '4075afdeef1d'
+down_revision: Union[str, None] = 'f1c42e2394d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match the output dimension of the model used by EmbeddingService
+EMBEDDING_DIM = 384
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS vector')
+
+    # Convert the float array in place so existing rows are kept
+    op.alter_column('document_chunks', 'embedding',
+               existing_type=postgresql.ARRAY(sa.FLOAT(precision=6)),
+               type_=Vector(EMBEDDING_DIM),
+               existing_nullable=True,
+               postgresql_using=f'embedding::vector({EMBEDDING_DIM})')
+
+    # ANN index used by the <=> (cosine distance) operator in SearchService.
+    # CONCURRENTLY cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_chunks_embedding_hnsw', 'document_chunks', ['embedding'],
+                   unique=False,
+                   postgresql_using='hnsw',
+                   postgresql_with={'m': 16, 'ef_construction': 64},
+                   postgresql_ops={'embedding': 'vector_cosine_ops'},
+                   postgresql_concurrently=True,
+                   if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_chunks_embedding_hnsw', table_name='document_chunks',
+                   postgresql_concurrently=True,
+                   if_exists=True)
+    op.alter_column('document_chunks', 'embedding',
+               existing_type=Vector(EMBEDDING_DIM),
+               type_=postgresql.ARRAY(sa.FLOAT(precision=6)),
+               existing_nullable=True,
+               postgresql_using='embedding::real[]')
@@ -0,0 +1,46 @@
+"""replace ivfflat embedding index with hnsw
+
+Revision ID: 528656919103
+Revises: d8765b6d2c4e
+Create Date: 2026-10-15 11:02:17.514203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '528656919103'
+down_revision: Union[str, None] = 'd8765b6d2c4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Databases bootstrapped with create_all() got the model's old ivfflat
+    # L2 index, which the cosine-distance search can't use. Build the HNSW
+    # index first so search is never left without an ANN index.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_chunks_embedding_hnsw', 'document_chunks', ['embedding'],
+                   unique=False,
+                   postgresql_using='hnsw',
+                   postgresql_with={'m': 16, 'ef_construction': 64},
+                   postgresql_ops={'embedding': 'vector_cosine_ops'},
+                   postgresql_concurrently=True,
+                   if_not_exists=True)
+        op.drop_index('idx_document_chunks_embedding', table_name='document_chunks',
+                   postgresql_concurrently=True,
+                   if_exists=True)
+
+
+def downgrade() -> None:
+    # ix_chunks_embedding_hnsw belongs to 4075afdeef1d, so it stays
+    with op.get_context().autocommit_block():
+        op.create_index('idx_document_chunks_embedding', 'document_chunks', ['embedding'],
+                   unique=False,
+                   postgresql_using='ivfflat',
+                   postgresql_with={'lists': 100},
+                   postgresql_ops={'embedding': 'vector_l2_ops'},
+                   postgresql_concurrently=True,
+                   if_not_exists=True)
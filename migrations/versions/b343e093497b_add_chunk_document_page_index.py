@@ -0,0 +1,36 @@
+"""add chunk document page index
+
+Revision ID: b343e093497b
+Revises: 20658fc9ecf8
+Create Date: 2026-10-15 14:02:17.530846
+
+Expression index on (document_id, page_number), used by SearchService to
+fetch the pages around each match with an index range scan per match.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b343e093497b'
+down_revision: Union[str, None] = '20658fc9ecf8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_document_chunks_document_page', 'document_chunks',
+                   ['document_id', sa.text("((chunk_metadata ->> 'page_number')::integer)")],
+                   unique=False,
+                   postgresql_concurrently=True,
+                   if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_document_chunks_document_page', table_name='document_chunks',
+                   postgresql_concurrently=True,
+                   if_exists=True)
@@ -0,0 +1,61 @@
+"""store document chunk embeddings as halfvec
+
+Revision ID: b773e62a3652
+Revises: 528656919103
+Create Date: 2026-10-15 11:20:44.906318
+
+Halves the storage of every embedding and of the HNSW graph (fp16, 768
+bytes per 384-dim vector instead of 1536). Requires the pgvector extension
+0.7.0 or newer.
+
+The HNSW index's opclass is tied to the column type, so it is dropped
+before the conversion and rebuilt concurrently afterwards. The ALTER
+rewrites document_chunks under an ACCESS EXCLUSIVE lock; run it in a
+maintenance window on large tables.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import HALFVEC, Vector
+
+# revision identifiers, used by Alembic.
+revision: str = 'b773e62a3652'
+down_revision: Union[str, None] = '528656919103'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match the output dimension of the model used by EmbeddingService
+EMBEDDING_DIM = 384
+
+
+def _rebuild_hnsw_index(opclass: str) -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_chunks_embedding_hnsw', 'document_chunks', ['embedding'],
+                   unique=False,
+                   postgresql_using='hnsw',
+                   postgresql_with={'m': 16, 'ef_construction': 64},
+                   postgresql_ops={'embedding': opclass},
+                   postgresql_concurrently=True,
+                   if_not_exists=True)
+
+
+def upgrade() -> None:
+    op.drop_index('ix_chunks_embedding_hnsw', table_name='document_chunks', if_exists=True)
+    op.alter_column('document_chunks', 'embedding',
+               existing_type=Vector(EMBEDDING_DIM),
+               type_=HALFVEC(EMBEDDING_DIM),
+               existing_nullable=True,
+               postgresql_using=f'embedding::halfvec({EMBEDDING_DIM})')
+    _rebuild_hnsw_index('halfvec_cosine_ops')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_chunks_embedding_hnsw', table_name='document_chunks', if_exists=True)
+    op.alter_column('document_chunks', 'embedding',
+               existing_type=HALFVEC(EMBEDDING_DIM),
+               type_=Vector(EMBEDDING_DIM),
+               existing_nullable=True,
+               postgresql_using=f'embedding::vector({EMBEDDING_DIM})')
+    _rebuild_hnsw_index('vector_cosine_ops')
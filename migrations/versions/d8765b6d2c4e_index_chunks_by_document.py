@@ -0,0 +1,35 @@
+"""index document chunks by document
+
+Revision ID: d8765b6d2c4e
+Revises: 39c0fe67bbdf
+Create Date: 2026-10-15 10:41:52.877310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8765b6d2c4e'
+down_revision: Union[str, None] = '39c0fe67bbdf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # document_id leads, so this also serves plain document_id filters;
+    # id as second column keeps per-document scans in primary key order
+    with op.get_context().autocommit_block():
+        op.create_index('ix_document_chunks_document_id', 'document_chunks', ['document_id', 'id'],
+                   unique=False,
+                   postgresql_using='btree',
+                   postgresql_concurrently=True,
+                   if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_document_chunks_document_id', table_name='document_chunks',
+                   postgresql_concurrently=True,
+                   if_exists=True)
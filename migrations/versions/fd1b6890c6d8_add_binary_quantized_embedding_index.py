@@ -0,0 +1,41 @@
+"""add binary quantized embedding index
+
+Revision ID: fd1b6890c6d8
+Revises: b773e62a3652
+Create Date: 2026-10-15 11:47:05.238716
+
+HNSW index over binary_quantize(embedding) with Hamming distance, used as
+the candidate stage when SEARCH_RERANK_OVERSAMPLE is enabled. Each vector
+is stored as 384 bits, so the graph is a fraction of the halfvec one.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'fd1b6890c6d8'
+down_revision: Union[str, None] = 'b773e62a3652'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Must match the output dimension of the model used by EmbeddingService
+EMBEDDING_DIM = 384
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_chunks_embedding_bq_hnsw', 'document_chunks',
+                   [sa.text(f'(binary_quantize(embedding)::bit({EMBEDDING_DIM})) bit_hamming_ops')],
+                   unique=False,
+                   postgresql_using='hnsw',
+                   postgresql_concurrently=True,
+                   if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_chunks_embedding_bq_hnsw', table_name='document_chunks',
+                   postgresql_concurrently=True,
+                   if_exists=True)
@@ -76,6 +76,38 @@ def display_image(image_path: str):
     except Exception as e:
         st.error(f"Error displaying image: {str(e)}")
 
+def stream_enhanced_search(search_payload: Dict, message_placeholder) -> Dict:
+    """
+    Calls /search/enhanced in streaming mode, showing the answer in the
+    placeholder as it is generated. Returns the same dict as the
+    non-streaming endpoint once the answer is complete.
+    """
+    results = {
+        "query": search_payload["query"],
+        "product_id": search_payload["product_id"],
+        "llm_response": ""
+    }
+    with requests.get(
+        f"{API_BASE_URL}/search/enhanced",
+        params={**search_payload, "stream": "true"},
+        stream=True
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if "error" in event:
+                raise RuntimeError(event["error"])
+            if "search_results" in event:
+                results["search_results"] = event["search_results"]
+            if "token" in event:
+                results["llm_response"] += event["token"]
+                message_placeholder.markdown(results["llm_response"] + "▌")
+            if event.get("done"):
+                break
+    return results
+
 def display_search_results_in_chat(results: Dict, show_details: bool):
     """Formats and displays search results within the chat interface."""
     # Display LLM response first
@@ -338,10 +370,9 @@ def main():
                 logger.info(f"Sending search request: {search_payload}")
 
                 try:
-                    # Call the search API - Reverted to /search/enhanced
-                    search_response = requests.get(f"{API_BASE_URL}/search/enhanced", params=search_payload) # Use GET and params, back to /enhanced
-                    search_response.raise_for_status() # Raise for bad status codes
-                    results = search_response.json()
+                    # Call the search API - /search/enhanced, streamed so the answer
+                    # appears as it is generated instead of after the whole completion
+                    results = stream_enhanced_search(search_payload, message_placeholder)
                     logger.info(f"Received search results: {json.dumps(results)[:200]}...") # Log snippet
 
                     # Display results using the dedicated function
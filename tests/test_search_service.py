@@ -0,0 +1,81 @@
+import asyncio
+import importlib.util
+import sys
+import types
+
+import numpy as np
+import pytest
+
+# These tests never load the embedding model (queries come with precomputed
+# embeddings), so stand in for the model libraries when they aren't installed
+if importlib.util.find_spec("sentence_transformers") is None:
+    sys.modules.setdefault("torch", types.ModuleType("torch"))
+    sentence_transformers = types.ModuleType("sentence_transformers")
+    sentence_transformers.SentenceTransformer = object
+    sys.modules.setdefault("sentence_transformers", sentence_transformers)
+
+from sqlalchemy import text
+
+from app.database import AsyncSessionLocal
+from app.services.search_service import SearchService
+
+
+class _EmptyResult:
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+
+class _RecordingSession:
+    """Stands in for an AsyncSession, keeping the statements it was given."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement, params=None, **kwargs):
+        self.statements.append((str(statement), params))
+
+    async def stream(self, statement, params=None, **kwargs):
+        self.statements.append((str(statement), params))
+        return _EmptyResult()
+
+
+def _search_service(db) -> SearchService:
+    # Skip __init__ so the embedding model isn't loaded; every search below
+    # passes a precomputed query embedding
+    service = SearchService.__new__(SearchService)
+    service.db = db
+    return service
+
+
+def _random_embedding() -> np.ndarray:
+    embedding = np.random.default_rng().standard_normal(384).astype(np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+
+def test_fractional_threshold_is_bound_as_float():
+    db = _RecordingSession()
+    asyncio.run(
+        _search_service(db).search("pump", threshold=0.3, query_embedding=_random_embedding())
+    )
+
+    sql, params = db.statements[-1]
+    assert ":threshold" not in sql
+    assert isinstance(params["max_distance"], float)
+    assert params["max_distance"] == pytest.approx(0.7)
+
+
+def test_search_with_fractional_threshold_runs_on_postgres():
+    async def run():
+        async with AsyncSessionLocal() as db:
+            try:
+                await db.execute(text("SELECT 1"))
+            except Exception as e:
+                pytest.skip(f"Postgres is not reachable: {e}")
+            return await _search_service(db).search(
+                "pump", threshold=0.3, query_embedding=_random_embedding()
+            )
+
+    assert isinstance(asyncio.run(run()), list)
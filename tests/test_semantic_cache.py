@@ -0,0 +1,68 @@
+import numpy as np
+
+from app.services import semantic_cache
+from app.services.semantic_cache import SemanticCache
+
+
+def _unit(*values) -> np.ndarray:
+    embedding = np.array(values, dtype=np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+
+def test_similar_query_is_a_hit():
+    cache = SemanticCache(capacity=4, dim=3, threshold=0.95)
+    cache.put(_unit(1, 0, 0), "params", "results")
+
+    assert cache.get(_unit(1, 0.1, 0), "params") == "results"
+
+
+def test_dissimilar_query_is_a_miss():
+    cache = SemanticCache(capacity=4, dim=3, threshold=0.95)
+    cache.put(_unit(1, 0, 0), "params", "results")
+
+    assert cache.get(_unit(1, 1, 0), "params") is None
+
+
+def test_different_params_are_a_miss():
+    cache = SemanticCache(capacity=4, dim=3, threshold=0.95)
+    cache.put(_unit(1, 0, 0), (1, None, 5), "results")
+
+    assert cache.get(_unit(1, 0, 0), (2, None, 5)) is None
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(semantic_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticCache(capacity=4, dim=3, ttl=60)
+    cache.put(_unit(1, 0, 0), "params", "results")
+
+    now[0] += 59
+    assert cache.get(_unit(1, 0, 0), "params") == "results"
+    now[0] += 2
+    assert cache.get(_unit(1, 0, 0), "params") is None
+
+
+def test_least_recently_used_entry_is_evicted_at_capacity():
+    cache = SemanticCache(capacity=2, dim=3)
+    cache.put(_unit(1, 0, 0), "params", "x")
+    cache.put(_unit(0, 1, 0), "params", "y")
+    # Touch x, so y is the least recently used when z arrives
+    assert cache.get(_unit(1, 0, 0), "params") == "x"
+    cache.put(_unit(0, 0, 1), "params", "z")
+
+    assert len(cache) == 2
+    assert cache.get(_unit(1, 0, 0), "params") == "x"
+    assert cache.get(_unit(0, 1, 0), "params") is None
+    assert cache.get(_unit(0, 0, 1), "params") == "z"
+
+
+def test_clear_drops_every_entry():
+    cache = SemanticCache(capacity=4, dim=3)
+    cache.put(_unit(1, 0, 0), "params", "x")
+    cache.put(_unit(0, 1, 0), "params", "y")
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.get(_unit(1, 0, 0), "params") is None
+    cache.put(_unit(0, 1, 0), "params", "y")
+    assert cache.get(_unit(0, 1, 0), "params") == "y"